@@ -0,0 +1,309 @@
+import asyncio
+import re
+import threading
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.encoding import escape_uri_path, iri_to_uri
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+
+from .catalog import get_catalog
+from .mixins import get_catalog_etag, get_recipes_etag
+from .recipe_cache import PAGE_KEY
+from .shopping_utils import SHOPPING_LIST_FORMATS, get_shopping_list
+
+# Сколько частей файла поток может подготовить, пока клиент не забрал.
+STREAM_QUEUE_SIZE = 8
+STREAM_START = object()
+STREAM_END = object()
+
+
+def run_db(func, *args):
+    """
+    Выполняет синхронный код с запросами к базе в пуле потоков.
+    Соединения потоков пула закрываются по тем же правилам, что
+    и в обычном запросе (CONN_MAX_AGE, ошибки).
+    """
+    def call():
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+class AsyncRequest:
+    """ Разобранный HTTP-запрос из scope ASGI. """
+    def __init__(self, scope):
+        self.path = scope['path']
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.query = {key: values[-1] for key, values
+                      in parse_qs(self.query_string).items()}
+        self.headers = {name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in scope['headers']}
+
+    def get_full_path(self):
+        """ Как HttpRequest.get_full_path, чтобы ETag совпадали с WSGI. """
+        path = escape_uri_path(self.path)
+        if self.query_string:
+            path += '?' + iri_to_uri(self.query_string)
+        return path
+
+    @property
+    def wants_json(self):
+        """ Браузерный API (text/html, ?format=) отдаёт только WSGI. """
+        return ('format' not in self.query
+                and 'text/html' not in self.headers.get('accept', ''))
+
+    def not_modified(self, etag, last_modified=None):
+        """
+        Как get_conditional_response: If-Modified-Since проверяется,
+        только если нет If-None-Match; last_modified - в секундах.
+        """
+        if 'if-none-match' in self.headers:
+            return etag in parse_etags(self.headers['if-none-match'])
+        since = parse_http_date_safe(
+            self.headers.get('if-modified-since', ''))
+        return (last_modified is not None and since is not None
+                and last_modified <= since)
+
+
+def get_headers(headers):
+    """
+    Заголовки ответа для ASGI. X-Frame-Options добавляется так же,
+    как XFrameOptionsMiddleware, остальные middleware Django эти
+    ответы не проходят (см. AsyncReadRouter).
+    """
+    headers = headers + [('X-Frame-Options', settings.X_FRAME_OPTIONS)]
+    return [(name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers]
+
+
+async def respond(send, status, headers, body=b''):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': get_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def catalog_response(request, send, get_data):
+    catalog = await run_db(get_catalog)
+    etag = get_catalog_etag(catalog, request.get_full_path())
+    headers = [
+        ('ETag', etag), ('Vary', 'Accept'),
+        ('Cache-Control',
+         f'public, max-age={settings.CATALOG_CACHE_MAX_AGE}')]
+    if request.not_modified(etag):
+        await respond(send, 304, headers)
+        return True
+    try:
+        data = get_data(catalog)
+    except (KeyError, ValueError):
+        return False
+    await respond(send, 200, headers + [
+        ('Content-Type', 'application/json')], JSONRenderer().render(data))
+    return True
+
+
+async def tags(request, send, pk=None):
+    if pk is None:
+        return await catalog_response(
+            request, send, lambda catalog: catalog.tag_list)
+    return await catalog_response(
+        request, send, lambda catalog: catalog.get_tag(int(pk)))
+
+
+async def ingredients(request, send, pk=None):
+    if pk is not None:
+        return await catalog_response(
+            request, send, lambda catalog: catalog.get_ingredient(int(pk)))
+    query = request.query.get('name') or request.query.get('ingredient_name')
+    if not query:
+        return await catalog_response(
+            request, send, lambda catalog: catalog.ingredient_list)
+    try:
+        limit = int(request.query.get(
+            'limit', settings.INGREDIENT_SEARCH_LIMIT))
+    except ValueError:
+        return False
+    limit = max(1, min(limit, settings.INGREDIENT_SEARCH_LIMIT))
+    return await catalog_response(
+        request, send,
+        lambda catalog: catalog.ingredient_index.search(query, limit))
+
+
+async def recipes(request, send, pk=None):
+    """
+    Анонимные страницы рецептов из кэша RecipeCacheMixin: ответ 304
+    или сохранённый JSON. Промах кэша отдаёт WSGI, он же его заполняет.
+    """
+    if 'authorization' in request.headers:
+        return False
+
+    def lookup():
+        etag, last_modified = get_recipes_etag(
+            AnonymousUser(), request.get_full_path())
+        content = None
+        if not request.not_modified(etag, last_modified):
+            content = cache.get(PAGE_KEY.format(etag.strip('"')))
+        return etag, last_modified, content
+
+    etag, last_modified, content = await run_db(lookup)
+    headers = [('ETag', etag), ('Cache-Control', 'public, no-cache'),
+               ('Vary', 'Accept, Authorization')]
+    if last_modified is not None:
+        headers.append(('Last-Modified', http_date(last_modified)))
+    if request.not_modified(etag, last_modified):
+        await respond(send, 304, headers)
+        return True
+    if content is None:
+        return False
+    await respond(send, 200, headers + [
+        ('Content-Type', 'application/json')], content)
+    return True
+
+
+def stream_in_thread(loop, queue, stopped, produce):
+    """
+    Запускает генератор produce в потоке пула и передаёт его элементы
+    в asyncio.Queue: очередь ограничена, поэтому поток ждёт, пока
+    клиент заберёт отправленное. Генератор целиком работает в одном
+    потоке, вместе со своим соединением с базой.
+    """
+    def put(item):
+        if not stopped.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def run():
+        close_old_connections()
+        try:
+            for item in produce():
+                if stopped.is_set():
+                    return
+                put(item)
+        except Exception as error:
+            put(error)
+        finally:
+            close_old_connections()
+            put(STREAM_END)
+    return loop.run_in_executor(None, run)
+
+
+async def download_shopping_cart(request, send):
+    """
+    Список покупок отправляется клиенту частями по мере того, как поток
+    пула читает строки из базы и рендерит файл, так что ни файл целиком
+    в памяти, ни медленное скачивание воркер не держат.
+    Ошибки (нет токена, пустой список, неизвестный формат) отдаёт WSGI.
+    """
+    keyword, _, key = request.headers.get('authorization', '').partition(' ')
+    file_format = request.query.get('format', 'txt')
+    if (keyword != TokenAuthentication.keyword
+            or file_format not in SHOPPING_LIST_FORMATS):
+        return False
+    content_type, render = SHOPPING_LIST_FORMATS[file_format]
+
+    def produce():
+        try:
+            user, _ = TokenAuthentication().authenticate_credentials(
+                key.strip())
+        except AuthenticationFailed:
+            return
+        shopping_list = get_shopping_list(user)
+        if shopping_list is None:
+            return
+        yield STREAM_START
+        for chunk in render(shopping_list):
+            yield chunk if isinstance(chunk, bytes) else chunk.encode()
+
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    stopped = threading.Event()
+    done = stream_in_thread(loop, queue, stopped, produce)
+    try:
+        item = await queue.get()
+        if isinstance(item, Exception):
+            raise item
+        if item is not STREAM_START:
+            return False
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': get_headers([
+                        ('Content-Type', content_type),
+                        ('Content-Disposition',
+                         f'attachment; filename=shopping_list.{file_format}'),
+                    ])})
+        while True:
+            item = await queue.get()
+            if item is STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            await send({'type': 'http.response.body', 'body': item,
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        return True
+    finally:
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await done
+
+
+ROUTES = (
+    (re.compile(r'^/api/tags/(?:(?P<pk>\d+)/)?$'), tags),
+    (re.compile(r'^/api/ingredients/(?:(?P<pk>\d+)/)?$'), ingredients),
+    (re.compile(r'^/api/recipes/download_shopping_cart/$'),
+     download_shopping_cart),
+    (re.compile(r'^/api/recipes/(?:(?P<pk>\d+)/)?$'), recipes),
+)
+
+
+class AsyncReadRouter:
+    """
+    ASGI-приложение: GET справочников, анонимных страниц рецептов из
+    кэша и скачивание списка покупок обрабатываются асинхронно, всё
+    остальное и случаи, которые обработчик не берёт на себя (вернул
+    False), передаются Django через fallback.
+    Асинхронные ответы не проходят MIDDLEWARE Django: нет сессий,
+    CSRF (это только GET) и профилирования QueryProfilingMiddleware;
+    SecurityMiddleware без настроек SECURE_* заголовков не добавляет,
+    X-Frame-Options ставит get_headers. При QUERY_PROFILING=True
+    асинхронные маршруты отключены, чтобы профиль видел все запросы.
+    """
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if (scope['type'] == 'http' and scope['method'] == 'GET'
+                and not settings.QUERY_PROFILING):
+            for pattern, handler in ROUTES:
+                match = pattern.match(scope['path'])
+                if match is None:
+                    continue
+                request = AsyncRequest(scope)
+                if (handler is download_shopping_cart
+                        or request.wants_json) and await handler(
+                            request, send, **match.groupdict()):
+                    return
+                break
+        await self.fallback(scope, receive, send)
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
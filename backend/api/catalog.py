@@ -0,0 +1,99 @@
+from django.http import Http404
+
+from recipes.models import Ingredient, Tag
+
+from .ingredient_search import IngredientIndex
+from .recipe_cache import bump_version, get_version
+
+VERSION_KEY = 'catalog:version'
+
+_catalog = None
+
+
+class Catalog:
+    """
+    Справочники тэгов и ингредиентов в памяти процесса.
+    Собирается заново, когда меняется общая версия в кэше Django.
+    """
+    def __init__(self, version):
+        self.version = version
+        self.tags = {
+            tag['id']: tag for tag in Tag.objects.order_by('id').values(
+                'id', 'name', 'color', 'slug')}
+        self.tag_list = list(self.tags.values())
+        self.tag_slugs = {tag['slug']: pk for pk, tag in self.tags.items()}
+        self.ingredients = {
+            pk: (name, unit) for pk, name, unit
+            in Ingredient.objects.order_by('id').values_list(
+                'id', 'name', 'measurement_unit').iterator()}
+        self.ingredient_index = IngredientIndex(
+            (pk, name, unit) for pk, (name, unit) in self.ingredients.items())
+        self._ingredient_list = None
+
+    @staticmethod
+    def find_missing(known, model, ids):
+        """
+        id, которых нет в справочнике. Неизвестные справочнику id
+        проверяются в базе одним запросом на случай, если каталог
+        ещё не пересобран после добавления записей.
+        """
+        unknown = {pk for pk in ids if pk not in known}
+        if unknown:
+            unknown -= set(model.objects.filter(
+                pk__in=unknown).values_list('pk', flat=True))
+        return sorted(unknown)
+
+    def find_missing_tags(self, ids):
+        return self.find_missing(self.tags, Tag, ids)
+
+    def find_missing_ingredients(self, ids):
+        return self.find_missing(self.ingredients, Ingredient, ids)
+
+    def get_tag(self, pk):
+        return self.tags[pk]
+
+    def get_ingredient(self, pk):
+        name, unit = self.ingredients[pk]
+        return {'id': pk, 'name': name, 'measurement_unit': unit}
+
+    @property
+    def ingredient_list(self):
+        if self._ingredient_list is None:
+            self._ingredient_list = [
+                self.get_ingredient(pk) for pk in self.ingredients]
+        return self._ingredient_list
+
+
+def get_or_404(getter, pk):
+    """ Достаёт запись справочника по id из URL или отдаёт 404. """
+    try:
+        return getter(int(pk))
+    except (KeyError, ValueError):
+        raise Http404
+
+
+def get_catalog_version():
+    """
+    Общая для всех процессов версия справочников. Если ключ пропал
+    из кэша, берётся новое значение от времени, чтобы оно не совпало
+    с версией, которую процессы уже держат в памяти.
+    """
+    return get_version(VERSION_KEY)
+
+
+def get_catalog():
+    global _catalog
+    version = get_catalog_version()
+    if _catalog is None or _catalog.version != version:
+        _catalog = Catalog(version)
+    return _catalog
+
+
+def bump_catalog_version():
+    """
+    Меняет версию после коммита транзакции, чтобы другие процессы
+    не успели собрать справочник по старым данным с новой версией.
+    Новая версия - время, а не incr: в файловом кэше incr не атомарен,
+    и два одновременных изменения дали бы одну и ту же версию.
+    """
+    bump_version(VERSION_KEY)
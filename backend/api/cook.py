@@ -0,0 +1,317 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from datetime import timedelta
+from fractions import Fraction
+from itertools import islice
+
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from recipes.models import IngredientInRecipe, Recipe, RecipeIngredientsChange
+
+# Журнал хранится сутки; процесс, который дольше не сверялся
+# с журналом, собирает индекс заново.
+CHANGE_TTL = 60 * 60 * 24
+# Если изменений накопилось больше, индекс проще собрать заново.
+MAX_PENDING_CHANGES = 1000
+# Пропуски в id журнала - ещё не закоммиченные (или откаченные)
+# транзакции: их перепроверяют, пока пропуск моложе GAP_TIMEOUT.
+GAP_TIMEOUT = 60
+GAP_LOOKBACK = 100
+# Как часто процесс удаляет из журнала записи старше CHANGE_TTL:
+# воркеры без перезапусков индекс не пересобирают.
+PRUNE_INTERVAL = 60 * 60
+
+_index = None
+_lock = threading.Lock()
+
+
+def set_bits(numbers, size):
+    """ Битовая маска (int) с единицами в позициях numbers. """
+    buffer = bytearray(size // 8 + 1)
+    for number in numbers:
+        buffer[number >> 3] |= 1 << (number & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def iter_bits(mask):
+    """ Позиции единиц маски от старших к младшим (новые рецепты первыми). """
+    while mask:
+        position = mask.bit_length() - 1
+        yield position
+        mask ^= 1 << position
+
+
+def count_bits(mask):
+    if hasattr(mask, 'bit_count'):
+        return mask.bit_count()
+    return bin(mask).count('1')
+
+
+def prune_changes():
+    """ Удаляет записи журнала старше CHANGE_TTL. """
+    RecipeIngredientsChange.objects.filter(
+        created__lt=timezone.now() - timedelta(seconds=CHANGE_TTL)).delete()
+
+
+class CookIndex:
+    """
+    Обратный индекс «ингредиент -> рецепты» в памяти процесса.
+    Список рецептов ингредиента хранится отсортированным array('I')
+    или битовой маской (int) по id рецепта - тем, что компактнее:
+    маска выгоднее, когда ингредиент есть больше чем в 1/32 рецептов.
+    Для подбора маски ингредиентов запроса складываются побитово
+    (по разрядам числа совпадений), а рецепты с k ингредиентами
+    заранее собраны в маски by_size[k], поэтому ответ стоит десятков
+    операций над масками, а не GROUP BY по IngredientInRecipe.
+    """
+    def __init__(self):
+        prune_changes()
+        self.pruned_at = time.monotonic()
+        self.last_change = RecipeIngredientsChange.objects.aggregate(
+            last=Max('pk'))['last'] or 0
+        self.gaps = {}
+        self.synced_at = time.monotonic()
+        self.add_gaps(self.last_change - GAP_LOOKBACK, self.last_change + 1,
+                      set(RecipeIngredientsChange.objects.filter(
+                          pk__gt=self.last_change - GAP_LOOKBACK).values_list(
+                              'pk', flat=True)))
+        max_id = Recipe.objects.aggregate(top=Max('pk'))['top'] or 0
+        self.sizes = array('H', bytes(2 * (max_id + 1)))
+        self.postings = {}
+        rows = IngredientInRecipe.objects.order_by(
+            'ingredient_id', 'recipe_id').values_list(
+                'ingredient_id', 'recipe_id').iterator()
+        current, posting = None, array('I')
+        for ingredient_id, recipe_id in rows:
+            if ingredient_id != current:
+                self.store(current, posting)
+                current, posting = ingredient_id, array('I')
+            if recipe_id >= len(self.sizes):
+                self.grow(recipe_id)
+            posting.append(recipe_id)
+            self.sizes[recipe_id] += 1
+        self.store(current, posting)
+        self.build_size_masks()
+
+    def add_gaps(self, start, stop, found):
+        for pk in range(max(start, 1), stop):
+            if pk not in found:
+                self.gaps.setdefault(pk, self.synced_at)
+
+    def sync(self):
+        """
+        Применяет изменения из журнала, записанные после сборки или
+        прошлой сверки, перепроверяет пропуски в id и раз
+        в PRUNE_INTERVAL чистит старые записи. False - индекс
+        отстал слишком сильно и его надо собрать заново.
+        """
+        now = time.monotonic()
+        if now - self.synced_at > CHANGE_TTL:
+            return False
+        self.gaps = {pk: seen for pk, seen in self.gaps.items()
+                     if now - seen < GAP_TIMEOUT}
+        changes = list(RecipeIngredientsChange.objects.filter(
+            Q(pk__gt=self.last_change) | Q(pk__in=list(self.gaps))
+        ).order_by('pk').values_list('pk', 'recipe_id')[
+            :MAX_PENDING_CHANGES + 1])
+        if len(changes) > MAX_PENDING_CHANGES:
+            return False
+        self.synced_at = now
+        if now - self.pruned_at > PRUNE_INTERVAL:
+            prune_changes()
+            self.pruned_at = now
+        if not changes:
+            return True
+        found = {pk for pk, _ in changes}
+        last_change = max(self.last_change, changes[-1][0])
+        self.add_gaps(max(self.last_change + 1,
+                          last_change - MAX_PENDING_CHANGES),
+                      last_change, found)
+        for pk in found:
+            self.gaps.pop(pk, None)
+        self.last_change = last_change
+        recipe_ids = {recipe_id for _, recipe_id in changes}
+        ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+        for recipe_id, ingredient_id in IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredient_id'):
+            ingredients[recipe_id].append(ingredient_id)
+        for recipe_id, ingredient_ids in ingredients.items():
+            self.set_recipe(recipe_id, ingredient_ids)
+        return True
+
+    def grow(self, recipe_id):
+        self.sizes.extend(bytes(2 * (recipe_id + 1 - len(self.sizes))))
+
+    def store(self, ingredient_id, posting):
+        if ingredient_id is None:
+            return
+        if len(posting) * 32 > len(self.sizes):
+            self.postings[ingredient_id] = set_bits(posting, len(self.sizes))
+        else:
+            self.postings[ingredient_id] = posting
+
+    def build_size_masks(self):
+        groups = {}
+        for recipe_id, size in enumerate(self.sizes):
+            if size:
+                groups.setdefault(size, []).append(recipe_id)
+        self.by_size = {size: set_bits(ids, len(self.sizes))
+                        for size, ids in groups.items()}
+
+    def get_mask(self, ingredient_id):
+        posting = self.postings.get(ingredient_id, 0)
+        if isinstance(posting, int):
+            return posting
+        return set_bits(posting, len(self.sizes))
+
+    def contains(self, ingredient_id, recipe_id):
+        posting = self.postings.get(ingredient_id, 0)
+        if isinstance(posting, int):
+            return bool(posting >> recipe_id & 1)
+        position = bisect_left(posting, recipe_id)
+        return position < len(posting) and posting[position] == recipe_id
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        """ Заменяет ингредиенты рецепта; пустой список - рецепт удалён. """
+        if recipe_id >= len(self.sizes):
+            self.grow(recipe_id)
+        bit = 1 << recipe_id
+        new = set(ingredient_ids)
+        for ingredient_id, posting in list(self.postings.items()):
+            if ingredient_id in new or not self.contains(
+                    ingredient_id, recipe_id):
+                continue
+            if isinstance(posting, int):
+                self.postings[ingredient_id] = posting & ~bit
+            else:
+                del posting[bisect_left(posting, recipe_id)]
+        for ingredient_id in new:
+            if self.contains(ingredient_id, recipe_id):
+                continue
+            posting = self.postings.setdefault(ingredient_id, array('I'))
+            if isinstance(posting, int):
+                self.postings[ingredient_id] = posting | bit
+            else:
+                insort(posting, recipe_id)
+        old_size = self.sizes[recipe_id]
+        if old_size:
+            self.by_size[old_size] &= ~bit
+        self.sizes[recipe_id] = len(new)
+        if new:
+            self.by_size[len(new)] = self.by_size.get(len(new), 0) | bit
+
+    def match(self, ingredient_ids, min_coverage=0):
+        """
+        Группы рецептов по убыванию покрытия (доля ингредиентов рецепта,
+        которые есть в ingredient_ids): [(покрытие, недостаёт, маска)].
+        """
+        ingredient_ids = set(ingredient_ids)
+        planes = []
+        for ingredient_id in ingredient_ids:
+            carry = self.get_mask(ingredient_id)
+            for number, plane in enumerate(planes):
+                planes[number], carry = plane ^ carry, plane & carry
+                if not carry:
+                    break
+            if carry:
+                planes.append(carry)
+        full = (1 << len(self.sizes)) - 1
+
+        def matched(count):
+            if count >> len(planes):
+                return 0
+            mask = full
+            for number, plane in enumerate(planes):
+                mask &= plane if count >> number & 1 else full ^ plane
+            return mask
+
+        pairs = sorted(
+            ((Fraction(count, size), count, size)
+             for size in self.by_size
+             for count in range(1, min(size, len(ingredient_ids)) + 1)
+             if Fraction(count, size) >= min_coverage),
+            reverse=True)
+        counts = {}
+        groups = []
+        for coverage, count, size in pairs:
+            if count not in counts:
+                counts[count] = matched(count)
+            mask = counts[count] & self.by_size[size]
+            if mask:
+                groups.append((coverage, size - count, mask))
+        return groups
+
+
+class CookMatches:
+    """
+    Подобранные рецепты по убыванию покрытия, внутри одного покрытия -
+    новые первыми: (id рецепта, покрытие, сколько недостаёт).
+    Срез достаёт id только нужной страницы, поэтому подходит
+    для пагинации как обычный список.
+    """
+    def __init__(self, groups):
+        self.groups = groups
+
+    @cached_property
+    def count(self):
+        found = 0
+        for *_, mask in self.groups:
+            found |= mask
+        return count_bits(found)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        start, stop, _ = item.indices(self.count)
+        wanted = stop - start
+        matches = []
+        for coverage, missing, mask in self.groups:
+            if len(matches) >= wanted:
+                break
+            if start:
+                size = count_bits(mask)
+                if start >= size:
+                    start -= size
+                    continue
+            for recipe_id in islice(iter_bits(mask), start,
+                                    start + wanted - len(matches)):
+                matches.append((recipe_id, float(coverage), missing))
+            start = 0
+        return matches
+
+
+def find_recipes(ingredient_ids, min_coverage=0):
+    """ Рецепты, которые можно приготовить из ingredient_ids (CookMatches). """
+    return CookMatches(get_cook_index().match(ingredient_ids, min_coverage))
+
+
+def get_cook_index():
+    """
+    Индекс процесса, сверенный с журналом изменений: новые записи
+    применяются к индексу, при большом отставании он собирается заново.
+    """
+    global _index
+    with _lock:
+        if _index is None or not _index.sync():
+            _index = CookIndex()
+        return _index
+
+
+def publish_recipes(recipe_ids):
+    """
+    Записывает в журнал, что состав рецептов изменился (или они
+    удалены). Вызывается в транзакции изменения, поэтому запись
+    видна процессам одновременно с новым составом.
+    """
+    RecipeIngredientsChange.objects.bulk_create(
+        RecipeIngredientsChange(recipe_id=recipe_id)
+        for recipe_id in recipe_ids)
+
+
+def publish_recipe(recipe_id):
+    publish_recipes([recipe_id])
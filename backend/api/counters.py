@@ -0,0 +1,52 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe, User
+
+# (модель со счётчиком, поле счётчика, считаемая модель, ссылка на первую)
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарно меняет счётчик на delta выражением F().
+    Ниже нуля счётчик не опускается, расхождения чинит reconcile_counters.
+    """
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def get_live_count(counted, link):
+    """ Подзапрос COUNT(*) по counted для строки внешнего запроса. """
+    return Coalesce(Subquery(
+        counted.objects.filter(**{link: OuterRef('pk')}).order_by().values(
+            link).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()), 0)
+
+
+def get_counter_drift(model, field, counted, link):
+    """ Строки, где сохранённый счётчик расходится с реальным числом. """
+    return model.objects.annotate(live=get_live_count(counted, link)).exclude(
+        **{field: F('live')})
+
+
+def reconcile_counters():
+    """
+    Пересчитывает разошедшиеся счётчики одним UPDATE на каждый.
+    Возвращает {поле: число исправленных строк}.
+    """
+    fixed = {}
+    for model, field, counted, link in COUNTERS:
+        drift = get_counter_drift(
+            model, field, counted, link).values_list('pk', flat=True)
+        fixed[field] = model.objects.filter(pk__in=list(drift)).update(
+            **{field: get_live_count(counted, link)})
+    return fixed
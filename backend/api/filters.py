@@ -1,15 +1,21 @@
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
 from recipes.models import Favorite, Recipe, ShoppingCart
 
+from .catalog import get_catalog
+from .search import search_recipes
+
 
 class RecipeFilter(FilterSet):
     """
     Фильтрует рецепты по отношению к тегам, автору,
     избранному и нахождению в корзине пользователя.
+    search - полнотекстовый поиск по названию и описанию с сортировкой
+    по релевантности, search_ingredients=1 - ещё и по ингредиентам.
     """
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.MultipleChoiceFilter(method='filter_tags')
+    search = filters.CharFilter(method='skip_filter')
+    search_ingredients = filters.BooleanFilter(method='skip_filter')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
@@ -17,7 +23,26 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'search_ingredients')
+
+    def __init__(self, *args, **kwargs):
+        """ Допустимые слаги тэгов берутся из кэша справочников. """
+        super().__init__(*args, **kwargs)
+        self.tag_slugs = get_catalog().tag_slugs
+        self.filters['tags'].extra['choices'] = [
+            (slug, slug) for slug in self.tag_slugs]
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты хотя бы с одним из тэгов: id IN (подзапрос к таблице связи)
+        вместо JOIN, поэтому рецепт не повторяется при нескольких тэгах.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=Recipe.tags.through.objects.filter(
+            tag_id__in=[self.tag_slugs[slug] for slug in value]).values(
+                'recipe_id'))
 
     def filter_is_favorited(self, queryset, name, value):
         reс_pk = Favorite.objects.filter(
@@ -33,9 +58,19 @@ class RecipeFilter(FilterSet):
             return queryset.filter(pk__in=reс_pk)
         return queryset
 
+    def filter_queryset(self, queryset):
+        """
+        Поиск применяется после остальных фильтров: без Postgres
+        он возвращает не QuerySet, а ранжированный список (RankedRecipes).
+        """
+        queryset = super().filter_queryset(queryset)
+        query = self.form.cleaned_data.get('search') or ''
+        if not query.strip():
+            return queryset
+        return search_recipes(
+            queryset, query,
+            ingredients=bool(self.form.cleaned_data.get('search_ingredients')))
 
-class SearchFilterIngr(SearchFilter):
-    """
-    Кастомный фильтр для поиска по ингредиентам.
-    """
-    search_param = 'ingredient_name'
+    def skip_filter(self, queryset, name, value):
+        """ Поиск и его флаг применяет filter_queryset. """
+        return queryset
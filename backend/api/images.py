@@ -0,0 +1,180 @@
+import binascii
+import io
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+from recipes.models import MediaFile, Recipe
+from rest_framework import serializers
+
+from .recipe_cache import bump_recipes_version
+
+logger = logging.getLogger(__name__)
+
+# Кратно 4 символам base64, чтобы куски декодировались независимо.
+DECODE_CHUNK_SIZE = 64 * 1024
+IMAGE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+VARIANTS_DIR = 'recipes/variants'
+
+_executor = None
+
+
+class StreamingBase64ImageField(serializers.ImageField):
+    """
+    Картинка в base64 (data URI). Декодируется кусками во временный
+    файл на диске; формат и размеры проверяются по заголовку
+    через Pillow, без загрузки пикселей.
+    """
+    default_error_messages = {
+        'invalid_image': 'Загрузите корректное изображение '
+                         f'({", ".join(IMAGE_FORMATS)}) в base64.',
+        'too_large': 'Изображение больше {max_size} пикселей по стороне.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data:
+            self.fail('invalid_image')
+        data = data.partition(';base64,')[2] or data
+        image_file = TemporaryUploadedFile(
+            'upload', 'application/octet-stream', 0, None)
+        try:
+            for start in range(0, len(data), DECODE_CHUNK_SIZE):
+                image_file.write(binascii.a2b_base64(
+                    data[start:start + DECODE_CHUNK_SIZE]))
+            image_file.size = image_file.tell()
+            image_file.seek(0)
+            with Image.open(image_file) as image:
+                image_format, size = image.format, image.size
+        except (binascii.Error, OSError, ValueError,
+                Image.DecompressionBombError):
+            image_file.close()
+            self.fail('invalid_image')
+        if image_format not in IMAGE_FORMATS:
+            image_file.close()
+            self.fail('invalid_image')
+        if max(size) > settings.RECIPE_IMAGE_MAX_SIZE:
+            image_file.close()
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+        image_file.seek(0)
+        image_file.name = f'{uuid.uuid4()}.{IMAGE_FORMATS[image_format]}'
+        image_file.content_type = Image.MIME[image_format]
+        return image_file
+
+
+def get_variant_name(image_name, variant, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{VARIANTS_DIR}/{stem}/{variant}.{extension}'
+
+
+def get_variant_urls(recipe, request=None):
+    """
+    {вариант: {расширение: url}} для готовых уменьшенных копий
+    картинки рецепта или None, пока они не построены.
+    """
+    if not recipe.image or not recipe.image_variants_ready:
+        return None
+    urls = {}
+    for variant in settings.RECIPE_IMAGE_VARIANTS:
+        urls[variant] = {}
+        for extension in VARIANT_FORMATS:
+            url = default_storage.url(
+                get_variant_name(recipe.image.name, variant, extension))
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[variant][extension] = url
+    return urls
+
+
+def build_variants(image_name):
+    """
+    Строит все варианты картинки в WebP и JPEG. Картинки хранятся
+    по хэшу содержимого, поэтому готовые варианты повторной загрузки
+    той же картинки не пересобираются.
+    """
+    names = {(variant, extension): get_variant_name(
+        image_name, variant, extension)
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+        for extension in VARIANT_FORMATS}
+    if all(default_storage.exists(name) for name in names.values()):
+        return
+    with default_storage.open(image_name) as source:
+        original = Image.open(source)
+        largest = max(settings.RECIPE_IMAGE_VARIANTS.values())
+        original.draft('RGB', (largest, largest))
+        original = ImageOps.exif_transpose(original).convert('RGB')
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        for extension, image_format in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, image_format,
+                       quality=settings.RECIPE_IMAGE_QUALITY,
+                       optimize=True)
+            name = names[variant, extension]
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id, image_name):
+    """
+    Строит варианты и отмечает рецепт, если картинку
+    за это время не заменили. Ошибки пишутся в лог.
+    """
+    try:
+        build_variants(image_name)
+        if Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+                image_variants_ready=True, updated_at=timezone.now()):
+            bump_recipes_version()
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', image_name)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    return _executor
+
+
+def schedule_variants(recipe):
+    """ Ставит обработку картинки в пул после коммита транзакции. """
+    recipe_id, image_name = recipe.pk, recipe.image.name
+
+    def task():
+        try:
+            process_recipe_image(recipe_id, image_name)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: get_executor().submit(task))
+
+
+def change_references(name, delta):
+    """
+    Меняет число ссылок на файл. Строка создаётся с нулём,
+    поэтому одновременные изменения не теряются.
+    """
+    if not name:
+        return
+    if delta > 0:
+        MediaFile.objects.bulk_create(
+            [MediaFile(name=name, references=0)], ignore_conflicts=True)
+        MediaFile.objects.filter(name=name).update(
+            references=F('references') + delta)
+    else:
+        MediaFile.objects.filter(
+            name=name, references__gte=-delta).update(
+                references=F('references') + delta)
@@ -0,0 +1,143 @@
+import csv
+import json
+
+from django.conf import settings
+from django.db import transaction
+from recipes.models import Ingredient
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ImportRowError(ValueError):
+    """ Строка файла, из которой не получился ингредиент. """
+
+
+def get_key(name, measurement_unit):
+    return name.casefold(), measurement_unit.casefold()
+
+
+def clean_row(name, measurement_unit):
+    """ Пара (название, единицы) без лишних пробелов или ImportRowError. """
+    if not isinstance(name, str) or not isinstance(measurement_unit, str):
+        raise ImportRowError('название и единицы должны быть строками')
+    name, measurement_unit = name.strip(), measurement_unit.strip()
+    if not name or not measurement_unit:
+        raise ImportRowError('пустое название или единицы измерения')
+    if max(len(name), len(measurement_unit)) > settings.INGREDIENT_MAX_LENGTH:
+        raise ImportRowError('слишком длинное значение')
+    return name, measurement_unit
+
+
+def read_csv(file):
+    """ Строки CSV без заголовка: название, единицы измерения. """
+    for row in csv.reader(file):
+        if len(row) != 2:
+            yield ImportRowError(f'ожидалось 2 столбца, получено {len(row)}')
+            continue
+        yield row
+
+
+def read_json(file):
+    """
+    Элементы JSON-массива объектов с name и measurement_unit.
+    Файл читается кусками, в памяти только текущий объект.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise ImportRowError('ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise ImportRowError('JSON-массив оборван')
+                break
+            position = end
+            if not isinstance(item, dict):
+                yield ImportRowError('элемент массива не объект')
+                continue
+            yield item.get('name'), item.get('measurement_unit')
+        if not chunk:
+            raise ImportRowError('JSON-массив оборван')
+
+
+def import_batch(batch, existing):
+    """
+    Сохраняет пачку строк: новые создаются одним bulk_create,
+    у найденных без учёта регистра обновляется написание.
+    """
+    new = []
+    changed = []
+    for key, (name, measurement_unit) in batch.items():
+        if key not in existing:
+            new.append(Ingredient(
+                name=name, measurement_unit=measurement_unit))
+            continue
+        pk, old_name, old_unit = existing[key]
+        if (old_name, old_unit) != (name, measurement_unit):
+            changed.append(Ingredient(
+                pk=pk, name=name, measurement_unit=measurement_unit))
+    with transaction.atomic():
+        Ingredient.objects.bulk_create(new)
+        Ingredient.objects.bulk_update(
+            changed, ['name', 'measurement_unit'])
+    return len(new), len(changed)
+
+
+def import_ingredients(rows, batch_size, on_error=None):
+    """
+    Загружает ингредиенты из итератора строк (read_csv, read_json).
+    Дубликаты отсеиваются множеством ключей (название, единицы)
+    без учёта регистра; каждая пачка пишется в своей транзакции,
+    поэтому импорт не держит блокировки на всю загрузку.
+    :return: словарь с числом inserted, updated и skipped строк;
+        skipped - ошибочные, повторные и уже загруженные строки.
+    """
+    existing = {
+        get_key(name, measurement_unit): (pk, name, measurement_unit)
+        for pk, name, measurement_unit in Ingredient.objects.values_list(
+            'pk', 'name', 'measurement_unit').iterator()}
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+    seen = set()
+    batch = {}
+    total = 0
+    for total, row in enumerate(rows, 1):
+        try:
+            if isinstance(row, ImportRowError):
+                raise row
+            name, measurement_unit = clean_row(*row)
+        except ImportRowError as error:
+            if on_error is not None:
+                on_error(total, error)
+            continue
+        key = get_key(name, measurement_unit)
+        if key in seen:
+            continue
+        seen.add(key)
+        batch[key] = name, measurement_unit
+        if len(batch) >= batch_size:
+            inserted, updated = import_batch(batch, existing)
+            counts['inserted'] += inserted
+            counts['updated'] += updated
+            batch = {}
+    if batch:
+        inserted, updated = import_batch(batch, existing)
+        counts['inserted'] += inserted
+        counts['updated'] += updated
+    counts['skipped'] = total - counts['inserted'] - counts['updated']
+    return counts
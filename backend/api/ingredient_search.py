@@ -0,0 +1,252 @@
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nsmallest
+
+MAX_TYPOS = 2
+# Слова короче этого ищутся с опечатками по индексу начал слов без
+# одной и двух букв: начала индексируются до длины SHORT_WORD + 1,
+# то есть до длины запроса плюс опечатки. В более длинных словах
+# не меньше 3 * MAX_TYPOS + 1 триграмм, и кандидаты берутся по ним.
+SHORT_WORD = 3 * MAX_TYPOS + 3
+
+
+def get_trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def get_deletions(value):
+    """ Строки, получающиеся из value удалением одной буквы. """
+    return {value[:i] + value[i + 1:] for i in range(len(value))}
+
+
+def freeze(postings):
+    """
+    Словарь списков -> словарь кортежей. Кортежи строк и чисел сборщик
+    мусора перестаёт отслеживать, и сотни тысяч списков индекса
+    не удлиняют каждую его полную проверку.
+    """
+    return {key: tuple(values) for key, values in postings.items()}
+
+
+def edit_distance(first, second, limit):
+    """
+    Расстояние Левенштейна с отсечкой: как только оно
+    гарантированно больше limit, возвращается limit + 1.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class IngredientIndex:
+    """
+    Поисковый индекс по названиям ингредиентов в памяти процесса.
+    Названия приведены к нижнему регистру (casefold) и отсортированы,
+    префикс ищется бинарным поиском, подстрока - по триграммам названий.
+    Опечатки ищутся по словарю слов из названий, поэтому их стоимость
+    зависит от числа разных слов, а не от числа ингредиентов.
+    Результаты ранжируются: точное совпадение, префикс,
+    подстрока, совпадение с одной опечаткой на слово; две опечатки
+    допускаются для длинных слов, если больше ничего не нашлось.
+    """
+    def __init__(self, rows):
+        entries = sorted(
+            (name.casefold(), pk, name, unit) for pk, name, unit in rows)
+        self.keys = [entry[0] for entry in entries]
+        self.items = [{'id': pk, 'name': name, 'measurement_unit': unit}
+                      for _, pk, name, unit in entries]
+        self.trigrams = defaultdict(list)
+        postings = defaultdict(set)
+        for position, key in enumerate(self.keys):
+            for trigram in get_trigrams(key):
+                self.trigrams[trigram].append(position)
+            for word_number, word in enumerate(key.split()):
+                postings[word].add((position, word_number))
+        self.words = sorted(postings)
+        self.word_positions = [tuple(postings[word]) for word in self.words]
+        self.word_trigrams = defaultdict(list)
+        self.prefixes = [defaultdict(list)
+                         for _ in range(SHORT_WORD + MAX_TYPOS)]
+        for number, word in enumerate(self.words):
+            for trigram in get_trigrams(word):
+                self.word_trigrams[trigram].append(number)
+            for size in range(1, min(len(word), len(self.prefixes) - 1) + 1):
+                self.prefixes[size][word[:size]].append(number)
+        # Начала слов по вариантам без одной и без двух букв. Без двух
+        # букв - только начала, с которыми сравниваются запросы с двумя
+        # опечатками: такие запросы длиннее 2 * MAX_TYPOS.
+        self.deletions = defaultdict(list)
+        self.double_deletions = defaultdict(list)
+        for bucket in self.prefixes:
+            for prefix in bucket:
+                deletions = get_deletions(prefix)
+                for variant in deletions | {prefix}:
+                    self.deletions[variant].append(prefix)
+                if len(prefix) < 2 * MAX_TYPOS + 1:
+                    continue
+                for variant in {double for variant in deletions
+                                for double in get_deletions(variant)}:
+                    self.double_deletions[variant].append(prefix)
+        self.trigrams = freeze(self.trigrams)
+        self.word_trigrams = freeze(self.word_trigrams)
+        self.prefixes = [freeze(bucket) for bucket in self.prefixes]
+        self.deletions = freeze(self.deletions)
+        self.double_deletions = freeze(self.double_deletions)
+
+    def search(self, query, limit):
+        query = query.casefold().strip()
+        if not query:
+            return self.items[:limit]
+        found = []
+        seen = set()
+
+        def collect(positions):
+            for position in positions:
+                if len(found) >= limit:
+                    return
+                if position not in seen:
+                    seen.add(position)
+                    found.append(position)
+
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end] == query:
+            end += 1
+        collect(range(start, end))
+        position = end
+        while (len(found) < limit and position < len(self.keys)
+               and self.keys[position].startswith(query)):
+            collect((position,))
+            position += 1
+        if len(found) < limit:
+            collect(self.find_substrings(query, seen, limit - len(found)))
+        if len(found) < limit:
+            collect(self.find_typos(query, seen, 1, limit - len(found)))
+        if not found:
+            collect(self.find_typos(query, seen, 2, limit))
+        return [self.items[position] for position in found]
+
+    @staticmethod
+    def rarest(trigrams, postings, count):
+        """
+        Номера, в которых есть хотя бы одна из count самых
+        редких триграмм.
+        """
+        lists = sorted((postings.get(trigram, ()) for trigram in trigrams),
+                       key=len)
+        numbers = set()
+        for posting in lists[:count]:
+            numbers.update(posting)
+        return numbers
+
+    def find_substrings(self, query, seen, limit):
+        trigrams = get_trigrams(query)
+        if not trigrams:
+            found = []
+            for position, key in enumerate(self.keys):
+                if len(found) >= limit:
+                    break
+                if position not in seen and query in key:
+                    found.append(position)
+            return found
+        matches = ((self.keys[position].find(query), self.keys[position],
+                    position)
+                   for position in self.rarest(trigrams, self.trigrams, 1)
+                   if position not in seen)
+        return [position for *_, position in sorted(
+            match for match in matches if match[0] > 0)]
+
+    def match_word(self, query, typos):
+        """
+        {позиция названия: (расстояние, номер слова в названии,
+        разница длины слова и query)} для
+        названий, где есть слово, начало которого отличается от query
+        не больше чем на typos правок.
+        Короткие слова сравниваются с началами слов из индексов
+        без букв (find_short). Одна правка ломает не больше трёх триграмм,
+        поэтому длинное слово содержит хотя бы одну из 3 * typos + 1
+        самых редких триграмм запроса. Слова не длиннее 2 * typos
+        сравниваются только по префиксу.
+        """
+        distances = {}
+        if len(query) <= 2 * typos:
+            start = bisect_left(self.words, query)
+            found = {}
+            while (start < len(self.words)
+                   and self.words[start].startswith(query)):
+                found[start] = 0
+                start += 1
+        elif len(query) < SHORT_WORD:
+            found = self.find_short(query, typos)
+        else:
+            sizes = range(len(query) - typos, len(query) + typos + 1)
+            found = {}
+            for number in self.rarest(get_trigrams(query), self.word_trigrams,
+                                      3 * typos + 1):
+                word = self.words[number]
+                distance = min(edit_distance(query, word[:size], typos)
+                               for size in sizes)
+                if distance <= typos:
+                    found[number] = distance
+        for number, distance in found.items():
+            length = abs(len(self.words[number]) - len(query))
+            for position, word_number in self.word_positions[number]:
+                rank = (distance, word_number, length)
+                if rank < distances.get(position, (typos + 1, 0, 0)):
+                    distances[position] = rank
+        return distances
+
+    def find_short(self, query, typos):
+        """
+        {номер слова: расстояние} для слов, начало которых отличается
+        от короткого query не больше чем на typos правок. Кандидаты
+        берутся из индексов начал слов без одной и без двух букв:
+        у начала и запроса, отличающихся на typos правок, совпадает
+        вариант, где у каждого удалено не больше typos букв. Расстояние
+        считается только для этих нескольких десятков начал.
+        """
+        variants = get_deletions(query) | {query}
+        indexes = [self.deletions]
+        if typos == 2:
+            variants |= {double for variant in variants
+                         for double in get_deletions(variant)}
+            indexes.append(self.double_deletions)
+        prefixes = {prefix for index in indexes for variant in variants
+                    for prefix in index.get(variant, ())}
+        found = {}
+        for prefix in prefixes:
+            distance = edit_distance(query, prefix, typos)
+            if distance > typos:
+                continue
+            for number in self.prefixes[len(prefix)][prefix]:
+                if distance < found.get(number, typos + 1):
+                    found[number] = distance
+        return found
+
+    def find_typos(self, query, seen, typos, limit):
+        total = None
+        for word in query.split():
+            distances = self.match_word(word, typos)
+            if total is None:
+                total = distances
+            else:
+                total = {position: (total[position][0] + distance,
+                                    *total[position][1:])
+                         for position, (distance, *_) in distances.items()
+                         if position in total}
+            if not total:
+                return []
+        return [position for *_, position in nsmallest(limit, (
+            (*rank, self.keys[position], position)
+            for position, rank in total.items()
+            if position not in seen))]
@@ -0,0 +1,336 @@
+import csv
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test.utils import (CaptureQueriesContext, setup_databases,
+                               teardown_databases)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.counters import reconcile_counters
+from api.search import update_search_vectors
+from api.shopping_utils import rebuild_cart_totals
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe, User
+
+BASELINE_FILE = os.path.join(settings.BASE_DIR, 'data', 'benchmark.json')
+BATCH_SIZE = 500
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#56CCF2')
+
+
+def seed(options, rnd):
+    """
+    Заполняет пустую тестовую базу синтетическими данными.
+    Масштаб задаётся опциями команды.
+    """
+    with open(os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+              'r', encoding='utf-8') as ing_file:
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in csv.reader(ing_file)),
+            batch_size=BATCH_SIZE)
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+    Tag.objects.bulk_create(
+        Tag(name=f'tag{number}', slug=f'tag{number}', color=color)
+        for number, color in enumerate(TAG_COLORS))
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+    User.objects.bulk_create(
+        User(email=f'bench{number}@foodgram.ru',
+             username=f'bench{number}',
+             first_name='Бенч', last_name='Марк')
+        for number in range(options['users']))
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    Recipe.objects.bulk_create(
+        (Recipe(author_id=rnd.choice(user_ids),
+                name=f'Рецепт {number}',
+                text='Описание рецепта',
+                image='recipes/images/temp.png',
+                cooking_time=rnd.randint(1, 120))
+         for number in range(options['recipes'])),
+        batch_size=BATCH_SIZE)
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+
+    Recipe.tags.through.objects.bulk_create(
+        (Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in rnd.sample(tag_ids, 2)),
+        batch_size=BATCH_SIZE)
+    IngredientInRecipe.objects.bulk_create(
+        (IngredientInRecipe(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                            amount=rnd.randint(1, 500))
+         for recipe_id in recipe_ids
+         for ingredient_id in rnd.sample(
+             ingredient_ids, options['ingredients_per_recipe'])),
+        batch_size=BATCH_SIZE)
+
+    def sample(population, size):
+        return rnd.sample(population, min(size, len(population)))
+
+    Favorite.objects.bulk_create(
+        (Favorite(recipe_lover_id=user_id, recipe_id=recipe_id)
+         for user_id in user_ids
+         for recipe_id in sample(recipe_ids, options['favorites'])),
+        batch_size=BATCH_SIZE)
+    ShoppingCart.objects.bulk_create(
+        (ShoppingCart(cart_owner_id=user_id, recipe_id=recipe_id)
+         for user_id in user_ids
+         for recipe_id in sample(recipe_ids, options['cart'])),
+        batch_size=BATCH_SIZE)
+    rebuild_cart_totals()
+    Subscribe.objects.bulk_create(
+        (Subscribe(user_id=user_id, author_id=author_id)
+         for user_id in user_ids
+         for author_id in sample(
+             [pk for pk in user_ids if pk != user_id],
+             options['subscriptions'])),
+        batch_size=BATCH_SIZE)
+    reconcile_counters()
+    update_search_vectors(Recipe.objects.all())
+
+
+def get_routes(user):
+    """
+    Маршруты из api/urls.py в виде (имя, метод, url).
+    """
+    recipe = Recipe.objects.exclude(author=user).first()
+    favorite_free = Recipe.objects.exclude(
+        pk__in=Favorite.objects.filter(
+            recipe_lover=user).values('recipe_id')).first()
+    cart_free = Recipe.objects.exclude(
+        pk__in=ShoppingCart.objects.filter(
+            cart_owner=user).values('recipe_id')).first()
+    author = User.objects.exclude(pk=user.pk).exclude(
+        pk__in=Subscribe.objects.filter(user=user).values('author_id')
+    ).first()
+    tag_slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+    pantry = IngredientInRecipe.objects.filter(
+        recipe__in=Recipe.objects.all()[:3]).values_list(
+            'ingredient_id', flat=True)
+    return (
+        ('recipes', 'get', '/api/recipes/'),
+        ('recipes-tags', 'get',
+         '/api/recipes/?' + '&'.join(f'tags={slug}' for slug in tag_slugs)),
+        ('recipes-author', 'get', f'/api/recipes/?author={author.pk}'),
+        ('recipes-favorited', 'get', '/api/recipes/?is_favorited=1'),
+        ('recipes-in-cart', 'get', '/api/recipes/?is_in_shopping_cart=1'),
+        ('recipes-search', 'get', '/api/recipes/?search=рецепт'),
+        ('recipes-cook', 'get',
+         '/api/recipes/cook/?' + '&'.join(
+             f'ingredients={pk}' for pk in pantry)),
+        ('recipe-detail', 'get', f'/api/recipes/{recipe.pk}/'),
+        ('tags', 'get', '/api/tags/'),
+        ('ingredients', 'get', '/api/ingredients/?name=а'),
+        ('users', 'get', '/api/users/'),
+        ('subscriptions', 'get',
+         '/api/users/subscriptions/?recipes_limit=3'),
+        ('subscribe', 'post', f'/api/users/{author.pk}/subscribe/'),
+        ('unsubscribe', 'delete', f'/api/users/{author.pk}/subscribe/'),
+        ('favorite-add', 'post',
+         f'/api/recipes/{favorite_free.pk}/favorite/'),
+        ('favorite-remove', 'delete',
+         f'/api/recipes/{favorite_free.pk}/favorite/'),
+        ('cart-add', 'post', f'/api/recipes/{cart_free.pk}/shopping_cart/'),
+        ('cart-remove', 'delete',
+         f'/api/recipes/{cart_free.pk}/shopping_cart/'),
+        ('download-shopping-cart', 'get',
+         '/api/recipes/download_shopping_cart/'),
+    )
+
+
+def get_explain_queries(user):
+    """
+    Горячие запросы API в виде (имя, queryset) для вывода планов EXPLAIN.
+    """
+    recipe = Recipe.objects.exclude(author=user).first()
+    author = recipe.author
+    ingredient_id = recipe.ingredients.values_list(
+        'ingredient_id', flat=True).first()
+    tag = Tag.objects.first()
+    return (
+        ('favorite-exists', Favorite.objects.filter(
+            recipe_lover=user, recipe=recipe)),
+        ('cart-exists', ShoppingCart.objects.filter(
+            cart_owner=user, recipe=recipe)),
+        ('subscribe-exists', Subscribe.objects.filter(
+            user=user, author=author)),
+        ('recipes-page', Recipe.objects.order_by('-pub_date', '-id')[:6]),
+        ('author-recipes', Recipe.objects.filter(
+            author=author).order_by('-pub_date')[:3]),
+        ('recipe-ingredient', IngredientInRecipe.objects.filter(
+            recipe=recipe, ingredient_id=ingredient_id)),
+        ('recipes-by-tag', Recipe.objects.filter(
+            tags__slug=tag.slug).order_by('-pub_date', '-id')[:6]),
+    )
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк API: число SQL-запросов, задержка p50/p95 и пиковая '
+            'память по каждому маршруту, сравнение с сохранённым эталоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Повторов каждого запроса')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--baseline', default=BASELINE_FILE)
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Записать результаты как новый эталон')
+        parser.add_argument('--compare', action='store_true',
+                            help='Ошибка, если эталона нет (для CI)')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Допустимый рост задержки и памяти, доля')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Не удалять тестовую базу после прогона')
+        parser.add_argument('--explain', action='store_true',
+                            help='Вывести планы EXPLAIN горячих запросов')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(
+            verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if not Recipe.objects.exists():
+                started = time.perf_counter()
+                seed(options, random.Random(options['seed']))
+                self.stdout.write(
+                    f'Данные сгенерированы за '
+                    f'{time.perf_counter() - started:.1f} с')
+            if options['explain']:
+                self.explain()
+            results = self.run_routes(options['repeat'])
+        finally:
+            teardown_databases(
+                old_config, verbosity=0, keepdb=options['keepdb'])
+
+        self.report(results)
+        if options['save_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(
+                f'Эталон сохранён в {options["baseline"]}'))
+            return
+        if not os.path.exists(options['baseline']):
+            if options['compare']:
+                raise CommandError(f'Эталон {options["baseline"]} не найден')
+            self.stdout.write(self.style.WARNING(
+                'Эталон не найден, сравнение пропущено'))
+            return
+        with open(options['baseline'], 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        errors = self.compare(results, baseline, options['tolerance'])
+        if errors:
+            raise CommandError('Превышен эталон:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Эталон не превышен'))
+
+    def explain(self):
+        user = User.objects.order_by('pk').first()
+        for name, queryset in get_explain_queries(user):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain())
+
+    def run_routes(self, repeat):
+        user = User.objects.order_by('pk').first()
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, method, url in get_routes(user):
+            # Первый прогон - с пустыми кэшами: число запросов эталона
+            # берётся по худшему случаю, иначе кэш фрагментов и страниц
+            # скрыл бы N+1 в сериализаторах.
+            for alias in ('default', 'versions'):
+                caches[alias].clear()
+            _, queries = self.send(client, name, method, url)
+            timings = []
+            for _ in range(repeat):
+                elapsed, warm_queries = self.send(client, name, method, url)
+                timings.append(elapsed)
+                queries = max(queries, warm_queries)
+            tracemalloc.start()
+            self.send(client, name, method, url)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name] = {
+                'queries': queries,
+                'p50_ms': round(statistics.median(timings) * 1000, 2),
+                'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+                'peak_kb': round(peak / 1024, 1),
+            }
+        return results
+
+    @staticmethod
+    def send(client, name, method, url):
+        """
+        Выполняет запрос и возвращает время ответа в секундах
+        и число SQL-запросов.
+        Удаление предваряется созданием, а созданное сразу удаляется,
+        чтобы каждый повтор шёл на одних и тех же данных.
+        """
+        if method == 'delete':
+            client.post(url)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(url)
+            if getattr(response, 'streaming', False):
+                for _chunk in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{name}: {method.upper()} {url} вернул '
+                f'{response.status_code}')
+        if method == 'post':
+            client.delete(url)
+        return elapsed, len(queries)
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"маршрут":<24}{"запросы":>9}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"память, КБ":>12}')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<24}{row["queries"]:>9}{row["p50_ms"]:>10}'
+                f'{row["p95_ms"]:>10}{row["peak_kb"]:>12}')
+
+    @staticmethod
+    def compare(results, baseline, tolerance):
+        errors = []
+        for name, row in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            if row['queries'] > expected['queries']:
+                errors.append(
+                    f'{name}: {row["queries"]} запросов вместо '
+                    f'{expected["queries"]}')
+            for key in ('p50_ms', 'p95_ms', 'peak_kb'):
+                if row[key] > expected[key] * (1 + tolerance):
+                    errors.append(
+                        f'{name}: {key} = {row[key]}, эталон {expected[key]}')
+        return errors
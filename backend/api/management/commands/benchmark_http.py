@@ -0,0 +1,85 @@
+import statistics
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_api import percentile
+
+DEFAULT_PATHS = ('/api/tags/', '/api/recipes/')
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер (gunicorn с настройками из '
+            'окружения) и выводит число запросов в секунду по адресам '
+            'для каждого числа параллельных клиентов. Запустите до и после '
+            'смены DB_CONN_MAX_AGE, DB_ENGINE, GUNICORN_WORKER_CLASS или '
+            'WSGI на ASGI, чтобы сравнить')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, nargs='+',
+                            default=[8],
+                            help='Число параллельных клиентов, можно '
+                                 'несколько: 8 64 256')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Секунд нагрузки на каждый адрес')
+        parser.add_argument('--token', help='Токен авторизации')
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        self.stdout.write(
+            f'{"адрес":<32}{"клиенты":>8}{"запр/с":>10}{"p50, мс":>10}'
+            f'{"p95, мс":>10}{"ошибки":>8}')
+        for path in options['paths']:
+            url = options['base_url'].rstrip('/') + path
+            for concurrency in options['concurrency']:
+                timings, errors = self.load(
+                    url, headers, concurrency, options['duration'])
+                if not timings:
+                    raise CommandError(f'{url}: нет успешных ответов')
+                self.stdout.write(
+                    f'{path:<32}{concurrency:>8}'
+                    f'{len(timings) / options["duration"]:>10.1f}'
+                    f'{statistics.median(timings) * 1000:>10.2f}'
+                    f'{percentile(timings, 0.95) * 1000:>10.2f}'
+                    f'{errors:>8}')
+
+    @staticmethod
+    def load(url, headers, concurrency, duration):
+        """
+        concurrency потоков по кругу запрашивают url, каждый в своей
+        сессии с keep-alive. Возвращает времена успешных ответов и число
+        ошибок.
+        """
+        timings = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            session = requests.Session()
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = session.get(url, headers=headers).ok
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        timings.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=client)
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, errors[0]
@@ -1,4 +1,48 @@
-from rest_framework import mixins, viewsets
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from rest_framework import mixins, status, viewsets
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .catalog import get_catalog
+from .recipe_cache import (PAGE_KEY, get_fragment_key, get_recipes_version,
+                           get_user_relations, get_user_version,
+                           overlay_relations)
+
+
+def get_catalog_etag(catalog, full_path):
+    return '"{}"'.format(md5(
+        f'{catalog.version}:{full_path}'.encode()).hexdigest())
+
+
+def get_recipes_etag(user, full_path):
+    """
+    ETag и Last-Modified (секунды или None) ответа с рецептами по версиям
+    рецептов, справочников и, для авторизованных, пользователя.
+    Версии - время в наносекундах, а Last-Modified - в целых секундах:
+    он округляется вверх и отдаётся, только когда эта секунда прошла.
+    Иначе изменение в ту же секунду не сменило бы Last-Modified,
+    и If-Modified-Since получил бы устаревший 304.
+    """
+    versions = [get_recipes_version(), get_catalog().version]
+    modified = max(versions)
+    if not user.is_anonymous:
+        user_version = get_user_version(user.pk)
+        versions += [user.pk, user_version]
+        modified = max(modified, user_version)
+    etag = '"{}"'.format(md5(':'.join(
+        map(str, versions + [full_path])).encode()).hexdigest())
+    last_modified = modified // 10 ** 9 + 1
+    if time.time() < last_modified:
+        last_modified = None
+    return etag, last_modified
 
 
 class CreateDestroyAll(mixins.CreateModelMixin,
@@ -6,3 +50,113 @@ class CreateDestroyAll(mixins.CreateModelMixin,
                        viewsets.GenericViewSet):
     """ Вьюсет определяющий методы POST и DELETE """
     pass
+
+
+class CatalogCacheMixin:
+    """
+    Отдаёт ответы справочников с ETag по версии каталога
+    и Cache-Control; на If-None-Match с тем же ETag отвечает 304.
+    """
+    def get_catalog_response(self, request, get_data):
+        catalog = get_catalog()
+        etag = get_catalog_etag(catalog, request.get_full_path())
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(get_data(catalog))
+        response['ETag'] = etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.CATALOG_CACHE_MAX_AGE}')
+        return response
+
+
+class RecipeCacheMixin:
+    """
+    Условные GET для чтения рецептов. ETag и Last-Modified считаются
+    по версиям в кэше (рецепты, справочники, а для авторизованных ещё и
+    избранное, покупки и подписки пользователя), поэтому ответ 304
+    на If-None-Match или If-Modified-Since отдаётся без запросов к базе.
+    Анонимные ответы в JSON целиком хранятся в кэше Django под ключом
+    с ETag. Ответ зависит от Accept (формат) и Authorization (флаги).
+    """
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            request, super().retrieve, *args, **kwargs)
+
+    def get_cached_response(self, request, get_response, *args, **kwargs):
+        user = request.user
+        etag, last_modified = get_recipes_etag(user, request.get_full_path())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        json = request.accepted_renderer.format == 'json'
+        if response is None and user.is_anonymous and json:
+            key = PAGE_KEY.format(etag.strip('"'))
+            content = cache.get(key)
+            if content is None:
+                response = get_response(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                content = JSONRenderer().render(response.data)
+                cache.set(key, content, settings.RECIPE_PAGE_CACHE_TIMEOUT)
+            response = HttpResponse(
+                content, content_type='application/json')
+        elif response is None:
+            response = get_response(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = (
+            'public, no-cache' if user.is_anonymous else 'private, no-cache')
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+
+class RecipeFragmentMixin:
+    """
+    Чтение рецептов через кэш сериализованных рецептов. Страница
+    выбирается лёгким запросом, сериализуются и подгружаются только
+    рецепты, которых нет в кэше; флаги избранного, покупок и подписки
+    проставляются из закэшированных id пользователя.
+    """
+    fragment_fields = ('id', 'author_id', 'pub_date', 'updated_at')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(
+            self.queryset.only(*self.fragment_fields))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.render_fragments(queryset))
+        return self.get_paginated_response(self.render_fragments(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = get_object_or_404(
+            self.queryset.only(*self.fragment_fields),
+            pk=kwargs[self.lookup_field])
+        self.check_object_permissions(request, instance)
+        fragments = self.render_fragments([instance])
+        if not fragments:
+            raise Http404
+        return Response(fragments[0])
+
+    def render_fragments(self, recipes):
+        catalog_version = get_catalog().version
+        base_url = self.request.build_absolute_uri('/')
+        keys = {recipe.pk: get_fragment_key(recipe, catalog_version, base_url)
+                for recipe in recipes}
+        fragments = cache.get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in fragments]
+        if missing:
+            serializer = self.get_serializer(
+                self.get_queryset().filter(pk__in=missing), many=True)
+            rendered = {keys[item['id']]: item for item in serializer.data}
+            cache.set_many(rendered, settings.RECIPE_FRAGMENT_TIMEOUT)
+            fragments.update(rendered)
+        relations = get_user_relations(self.request.user)
+        return [overlay_relations(fragments[keys[pk]], relations)
+                for pk in keys if keys[pk] in fragments]
@@ -0,0 +1,13 @@
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+class IgnoreFormatContentNegotiation(BaseContentNegotiation):
+    """
+    Всегда выбирает первый рендерер и не смотрит на ?format=,
+    когда вьюха использует этот параметр сама, например для формата файла.
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
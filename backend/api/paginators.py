@@ -1,6 +1,102 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк по плану запроса (EXPLAIN) без COUNT(*).
+    Планировщик оценивает только PostgreSQL, для остальных баз
+    возвращается точное значение.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class RankedPagination(PageNumberPagination):
+    """ Страницы готового ранжированного списка (без курсора и оценок). """
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
 
 
 class PageNumPagination(PageNumberPagination):
-    """ количество объектов на странице. """
-    page_size_query_param = 6
+    """
+    количество объектов на странице.
+    QUERY PARAMETERS: limit - размер страницы (не больше MAX_PAGE_SIZE);
+    cursor - курсорный режим без OFFSET по ordering вьюсета (cursor_ordering);
+    count - exact, estimate (по плану запроса) или, в курсорном режиме,
+    none (без подсчёта, по умолчанию).
+    Результаты поиска (ранжированный список резервного поиска или
+    QuerySet с rank) листаются только страницами: курсор по ordering
+    потерял бы порядок по релевантности, поэтому cursor при поиске
+    отклоняется. Число рецептов резервного поиска всегда точное.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        ranked = (not isinstance(queryset, QuerySet)
+                  or 'rank' in queryset.query.annotations)
+        in_cursor_mode = self.cursor_query_param in request.query_params
+        if in_cursor_mode and ranked:
+            raise ValidationError({
+                'errors': 'cursor нельзя использовать вместе с поиском: '
+                          'результаты упорядочены по релевантности'})
+        self.count_mode = request.query_params.get(
+            'count', 'none' if in_cursor_mode else 'exact')
+        count_modes = COUNT_MODES if in_cursor_mode else COUNT_MODES[:2]
+        if self.count_mode not in count_modes:
+            raise ValidationError({
+                'errors': f'count должен быть одним из: '
+                          f'{", ".join(count_modes)}'})
+        if not in_cursor_mode:
+            if (self.count_mode == 'estimate'
+                    and isinstance(queryset, QuerySet)):
+                self.django_paginator_class = EstimatedCountPaginator
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_pagination = LimitCursorPagination()
+        self.cursor_pagination.ordering = (
+            getattr(view, 'cursor_ordering', None)
+            or queryset.model._meta.ordering)
+        self.count = None
+        if self.count_mode == 'exact':
+            self.count = queryset.count()
+        elif self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        return self.cursor_pagination.paginate_queryset(
+            queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is None:
+            return super().get_paginated_response(data)
+        response = self.cursor_pagination.get_paginated_response(data)
+        if self.count is not None:
+            response.data['count'] = self.count
+            response.data.move_to_end('count', last=False)
+        return response
@@ -0,0 +1,123 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Списки параметров IN (%s, %s, ...) разной длины - один и тот же запрос.
+PARAMS_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+_local = threading.local()
+
+
+def get_fingerprint(sql):
+    return PARAMS_LIST.sub('(%s, ...)', sql)
+
+
+class RequestProfile:
+    """ SQL-запросы и время сериализаторов одного HTTP-запроса. """
+    def __init__(self):
+        self.queries = Counter()
+        self.db_seconds = 0
+        self.serializer_seconds = 0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        """ Обёртка connection.execute_wrapper, работает и без DEBUG. """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries[get_fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.queries.items()
+                if count > 1}
+
+    @property
+    def repeated(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+    def get_server_timing(self, seconds):
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};'
+            f'desc="{sum(self.queries.values())} queries, '
+            f'{self.repeated} repeated", '
+            f'serializer;dur={self.serializer_seconds * 1000:.1f}, '
+            f'total;dur={seconds * 1000:.1f}')
+
+
+class ProfiledSerializerMixin:
+    """
+    Прибавляет время to_representation к профилю текущего запроса.
+    Подмешивается первым к сериализаторам вьюсетов; при many=True
+    ListSerializer вызывает to_representation для каждого объекта.
+    Вложенные сериализаторы не считаются дважды, ленивые SQL-запросы
+    входят и во время БД.
+    """
+    def to_representation(self, instance):
+        profile = getattr(_local, 'profile', None)
+        if profile is None or profile.serializing:
+            return super().to_representation(instance)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            profile.serializer_seconds += time.perf_counter() - started
+            profile.serializing = False
+
+
+class QueryProfilingMiddleware:
+    """
+    Профилирование запросов (settings.QUERY_PROFILING): число и время
+    SQL, повторы одного запроса (признак N+1) и время сериализаторов.
+    Отдаются в заголовке Server-Timing и пишутся строкой JSON с именем
+    view в лог api.profiling: итоги по view считаются по логам всех
+    процессов, а не в памяти воркера. Профилируется доля
+    запросов QUERY_PROFILING_SAMPLE_RATE, остальные проходят без
+    обёрток. Запросы из тела потокового ответа не учитываются.
+    """
+    def __init__(self, get_response):
+        if not settings.QUERY_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.QUERY_PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = RequestProfile()
+        _local.profile = profile
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _local.profile = None
+        seconds = time.perf_counter() - started
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = profile.get_server_timing(seconds)
+        logger.info(json.dumps({
+            'view': view_name,
+            'method': request.method,
+            'status': response.status_code,
+            'ms': round(seconds * 1000, 1),
+            'queries': sum(profile.queries.values()),
+            'db_ms': round(profile.db_seconds * 1000, 1),
+            'serializer_ms': round(profile.serializer_seconds * 1000, 1),
+            'repeated': [
+                {'sql': sql[:200], 'count': count}
+                for sql, count in Counter(profile.duplicates).most_common(3)],
+        }, ensure_ascii=False))
+        return response
@@ -0,0 +1,99 @@
+import time
+from hashlib import md5
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscribe
+
+RECIPES_VERSION_KEY = 'recipes:version'
+USER_VERSION_KEY = 'recipes:user:{}'
+PAGE_KEY = 'recipes:page:{}'
+FRAGMENT_KEY = 'recipes:fragment:{}:{}:{}:{}'
+RELATIONS_KEY = 'recipes:relations:{}:{}'
+# Версии живут в отдельном кэше (settings.CACHES), чтобы страницы
+# и фрагменты их не вытесняли; пропавшая версия просто станет новой.
+VERSION_CACHE = 'versions'
+
+
+def get_version(key):
+    """
+    Версия - время последнего изменения в наносекундах, поэтому
+    она же служит Last-Modified. Пропавший из кэша ключ получает
+    текущее время и не совпадёт ни с одной выданной раньше версией.
+    """
+    versions = caches[VERSION_CACHE]
+    version = versions.get(key)
+    if version is None:
+        versions.add(key, time.time_ns(), timeout=None)
+        version = versions.get(key)
+    return version
+
+
+def bump_version(key):
+    """ Меняет версию после коммита транзакции. """
+    transaction.on_commit(lambda: caches[VERSION_CACHE].set(
+        key, time.time_ns(), timeout=None))
+
+
+def get_recipes_version():
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def bump_recipes_version():
+    """ Сбрасывает ETag и кэш страниц рецептов для всех пользователей. """
+    bump_version(RECIPES_VERSION_KEY)
+
+
+def get_user_version(user_id):
+    """ Версия избранного, списка покупок и подписок пользователя. """
+    return get_version(USER_VERSION_KEY.format(user_id))
+
+
+def bump_user_version(user_id):
+    bump_version(USER_VERSION_KEY.format(user_id))
+
+
+def get_fragment_key(recipe, catalog_version, base_url):
+    """
+    Ключ сериализованного рецепта без флагов пользователя: меняется
+    вместе с updated_at рецепта, версией справочников и адресом сайта,
+    от которого зависят ссылки на картинки.
+    """
+    updated_at = recipe.updated_at.timestamp() if recipe.updated_at else 0
+    return FRAGMENT_KEY.format(recipe.pk, updated_at, catalog_version,
+                               md5(base_url.encode()).hexdigest()[:8])
+
+
+def get_user_relations(user):
+    """
+    id избранных рецептов, рецептов в корзине и авторов в подписках
+    пользователя. Хранится в кэше под версией пользователя, поэтому
+    сбрасывается при любом изменении этих списков.
+    """
+    if user.is_anonymous:
+        return {'favorites': set(), 'cart': set(), 'follows': set()}
+    key = RELATIONS_KEY.format(user.pk, get_user_version(user.pk))
+    relations = cache.get(key)
+    if relations is None:
+        relations = {
+            'favorites': set(Favorite.objects.filter(
+                recipe_lover=user).values_list('recipe_id', flat=True)),
+            'cart': set(ShoppingCart.objects.filter(
+                cart_owner=user).values_list('recipe_id', flat=True)),
+            'follows': set(Subscribe.objects.filter(
+                user=user).values_list('author_id', flat=True)),
+        }
+        cache.set(key, relations)
+    return relations
+
+
+def overlay_relations(fragment, relations):
+    """ Копия фрагмента с флагами конкретного пользователя. """
+    return {
+        **fragment,
+        'author': {**fragment['author'], 'is_subscribed':
+                   fragment['author']['id'] in relations['follows']},
+        'is_favorited': fragment['id'] in relations['favorites'],
+        'is_in_shopping_cart': fragment['id'] in relations['cart'],
+    }
@@ -0,0 +1,183 @@
+import json
+from collections import Counter
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from recipes.models import IngredientInRecipe, Recipe
+from users.models import User
+
+from .catalog import get_catalog
+from .cook import publish_recipes
+from .counters import change_counter
+from .images import change_references
+from .recipe_cache import bump_recipes_version
+from .search import update_search_vectors
+
+
+class TransferError(ValueError):
+    """ Строка NDJSON, из которой не получился рецепт. """
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_recipes(batch_size):
+    """
+    Строки NDJSON с рецептами по возрастанию id. Рецепты читаются
+    пачками по id, поэтому в памяти только одна пачка. Автор указан
+    email, тэги - slug, ингредиенты - названием и единицами, чтобы
+    файл можно было загрузить в другую базу.
+    """
+    last_pk = 0
+    while True:
+        recipes = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+            'pk').select_related('author').prefetch_related(
+                'tags', 'ingredients__ingredient')[:batch_size])
+        if not recipes:
+            return
+        for recipe in recipes:
+            yield json.dumps({
+                'author': recipe.author.email,
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'pub_date': recipe.pub_date.isoformat(),
+                'image': recipe.image.name or None,
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [{
+                    'name': item.ingredient.name,
+                    'measurement_unit': item.ingredient.measurement_unit,
+                    'amount': item.amount,
+                } for item in recipe.ingredients.all()],
+            }, ensure_ascii=False) + '\n'
+        last_pk = recipes[-1].pk
+
+
+class RecipeImporter:
+    """
+    Загрузка рецептов из NDJSON пачками. Тэги и ингредиенты берутся
+    из справочника в памяти, авторы - одним запросом на пачку; рецепты,
+    ингредиенты рецептов и тэги пишутся bulk_create в одной транзакции
+    на пачку. Рецепты, которые у автора уже есть, пропускаются.
+    """
+    def __init__(self, on_error=None):
+        catalog = get_catalog()
+        self.tags = catalog.tag_slugs
+        self.ingredients = {
+            key: pk for pk, key in catalog.ingredients.items()}
+        self.on_error = on_error
+        self.counts = {'imported': 0, 'skipped': 0}
+
+    def parse(self, line):
+        try:
+            data = json.loads(line)
+            if not isinstance(data['author'], str):
+                raise TypeError('author должен быть email')
+            recipe = Recipe(
+                name=data['name'], text=data['text'],
+                cooking_time=data['cooking_time'],
+                image=data.get('image') or None)
+            recipe.clean_fields(exclude=['author', 'image'])
+            pub_date = parse_datetime(data.get('pub_date') or '')
+            tags = {self.tags[slug] for slug in data['tags']}
+            amounts = Counter()
+            for item in data['ingredients']:
+                key = item['name'], item['measurement_unit']
+                amounts[self.ingredients[key]] += item['amount']
+            for amount in amounts.values():
+                IngredientInRecipe(amount=amount).clean_fields(
+                    exclude=['recipe', 'ingredient'])
+        except (ValueError, TypeError) as error:
+            raise TransferError(f'неверные данные: {error}')
+        except KeyError as error:
+            raise TransferError(f'не найдено: {error}')
+        except ValidationError as error:
+            raise TransferError(error.message_dict)
+        return data['author'], recipe, pub_date, tags, amounts
+
+    def import_lines(self, lines, batch_size):
+        for batch in batches(enumerate(lines, 1), batch_size):
+            parsed = []
+            for number, line in batch:
+                if not line.strip():
+                    continue
+                try:
+                    parsed.append((number, *self.parse(line)))
+                except TransferError as error:
+                    self.skip(number, error)
+            self.import_batch(parsed)
+        bump_recipes_version()
+        return self.counts
+
+    def skip(self, number, error):
+        self.counts['skipped'] += 1
+        if self.on_error is not None:
+            self.on_error(number, error)
+
+    @transaction.atomic
+    def import_batch(self, parsed):
+        authors = dict(User.objects.filter(email__in={
+            row[1] for row in parsed}).values_list('email', 'pk'))
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={row[2].name for row in parsed}).values_list(
+                'author_id', 'name'))
+        rows = []
+        for number, email, recipe, pub_date, tags, amounts in parsed:
+            if email not in authors:
+                self.skip(number, TransferError(f'нет автора {email}'))
+                continue
+            recipe.author_id = authors[email]
+            if (recipe.author_id, recipe.name) in existing:
+                self.skip(number, TransferError(
+                    f'у автора уже есть рецепт {recipe.name}'))
+                continue
+            existing.add((recipe.author_id, recipe.name))
+            rows.append((recipe, pub_date, tags, amounts))
+        if not rows:
+            return
+        recipes = [recipe for recipe, *_ in rows]
+        Recipe.objects.bulk_create(recipes)
+        if any(recipe.pk is None for recipe in recipes):
+            # Без RETURNING (SQLite) id находятся по уникальной паре
+            # (автор, название).
+            pks = dict(((author_id, name), pk) for pk, author_id, name
+                       in Recipe.objects.filter(
+                           author_id__in={r.author_id for r in recipes},
+                           name__in={r.name for r in recipes}).values_list(
+                               'pk', 'author_id', 'name'))
+            for recipe in recipes:
+                recipe.pk = pks[recipe.author_id, recipe.name]
+        dated = []
+        for recipe, pub_date, *_ in rows:
+            if pub_date is not None:
+                recipe.pub_date = pub_date
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe_id=recipe.pk, ingredient_id=pk,
+                               amount=amount)
+            for recipe, _, _, amounts in rows
+            for pk, amount in amounts.items())
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, _, tags, _ in rows for tag_id in tags)
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]))
+        publish_recipes(recipe.pk for recipe in recipes)
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            change_counter(User, author_id, 'recipes_count', count)
+        images = Counter(recipe.image.name for recipe in recipes
+                         if recipe.image)
+        for name, count in images.items():
+            change_references(name, count)
+        self.counts['imported'] += len(recipes)
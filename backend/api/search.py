@@ -0,0 +1,169 @@
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from recipes.models import IngredientInRecipe, Recipe
+
+from .catalog import get_catalog
+from .recipe_cache import get_recipes_version
+
+SEARCH_CONFIG = 'russian'
+# Вес совпадений: название, описание, ингредиент.
+NAME_WEIGHT, TEXT_WEIGHT, INGREDIENT_WEIGHT = 1.0, 0.4, 0.2
+WORD = re.compile(r'\w+')
+# Окончания для упрощённого стемминга резервного индекса,
+# длинные раньше коротких.
+ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ой', 'ей',
+    'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ых', 'их', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ую', 'юю', 'а', 'я', 'о', 'е',
+    'ы', 'и', 'у', 'ю', 'ь', 'й'), key=len, reverse=True)
+MIN_STEM = 3
+# Сколько id резервного поиска передаётся в одном запросе: SQLite
+# ограничивает число параметров запроса (999 в старых сборках).
+RANKED_BATCH_SIZE = 500
+
+_index = None
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def get_search_vector():
+    """ tsvector рецепта: название важнее описания. """
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(queryset):
+    """ Пересчитывает Recipe.search_vector одним UPDATE (только Postgres). """
+    if is_postgresql():
+        return queryset.update(search_vector=get_search_vector())
+    return 0
+
+
+def stem(word):
+    word = word.casefold().replace('ё', 'е')
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def get_stems(text):
+    return [stem(word) for word in WORD.findall(text)]
+
+
+class RecipeSearchIndex:
+    """
+    Резервный поиск для баз без полнотекстового поиска (SQLite):
+    инвертированный индекс {основа слова: {id рецепта: вес}} в памяти
+    процесса. Собирается заново, когда меняется версия рецептов.
+    """
+    def __init__(self, version):
+        self.version = version
+        self.postings = defaultdict(dict)
+        rows = Recipe.objects.values_list('pk', 'name', 'text').iterator()
+        for pk, name, text in rows:
+            weights = Counter()
+            for word in get_stems(name):
+                weights[word] += NAME_WEIGHT
+            for word in get_stems(text):
+                weights[word] += TEXT_WEIGHT
+            for word, weight in weights.items():
+                self.postings[word][pk] = weight
+
+    def search(self, query):
+        """ {id рецепта: ранг} для рецептов со всеми словами запроса. """
+        words = set(get_stems(query))
+        if not words:
+            return {}
+        postings = sorted((self.postings.get(word, {}) for word in words),
+                          key=len)
+        ranks = dict(postings[0])
+        for posting in postings[1:]:
+            ranks = {pk: rank + posting[pk] for pk, rank in ranks.items()
+                     if pk in posting}
+        return ranks
+
+
+class RankedRecipes:
+    """
+    Рецепты queryset по рангу резервного поиска, при равном ранге -
+    новые первыми. Ранги есть только в памяти процесса, поэтому порядок
+    считается в Python по id и датам публикации, а сами рецепты читаются
+    только для запрошенного среза. Срез работает как у списка,
+    поэтому подходит для пагинации.
+    """
+    def __init__(self, queryset, ranks):
+        self.queryset = queryset
+        ids = list(ranks)
+        rows = []
+        for start in range(0, len(ids), RANKED_BATCH_SIZE):
+            rows.extend(queryset.filter(
+                pk__in=ids[start:start + RANKED_BATCH_SIZE]
+            ).order_by().values_list('pk', 'pub_date'))
+        rows.sort(key=lambda row: (ranks[row[0]], row[1], row[0]),
+                  reverse=True)
+        self.ids = [pk for pk, _ in rows]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        ids = self.ids[item]
+        recipes = self.queryset.in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
+
+
+def get_search_index():
+    global _index
+    version = get_recipes_version()
+    if _index is None or _index.version != version:
+        _index = RecipeSearchIndex(version)
+    return _index
+
+
+def find_ingredient_recipes(query):
+    """
+    id рецептов с ингредиентами, найденными поиском справочника
+    по запросу (префикс, подстрока, опечатки).
+    """
+    ingredient_ids = [item['id'] for item in get_catalog(
+    ).ingredient_index.search(query, settings.INGREDIENT_SEARCH_LIMIT)]
+    return IngredientInRecipe.objects.filter(
+        ingredient_id__in=ingredient_ids).values('recipe_id')
+
+
+def search_recipes(queryset, query, ingredients=False):
+    """
+    Рецепты по запросу, от более подходящих к менее подходящим.
+    На Postgres - QuerySet по search_vector (GIN-индекс, русский
+    стемминг), иначе RankedRecipes по индексу в памяти. С ingredients=True
+    находятся и рецепты с подходящими ингредиентами, ниже совпадений
+    по тексту.
+    """
+    if is_postgresql():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        matches = Q(search_vector=search_query)
+        rank = SearchRank(F('search_vector'), search_query)
+        if ingredients:
+            recipe_ids = find_ingredient_recipes(query)
+            matches |= Q(pk__in=recipe_ids)
+            rank = rank + Case(
+                When(pk__in=recipe_ids, then=Value(INGREDIENT_WEIGHT)),
+                default=Value(0.0), output_field=FloatField())
+        return queryset.filter(matches).annotate(rank=rank).order_by(
+            '-rank', '-pub_date', '-id')
+
+    ranks = get_search_index().search(query)
+    if ingredients:
+        for pk in find_ingredient_recipes(query).values_list(
+                'recipe_id', flat=True).distinct():
+            ranks[pk] = ranks.get(pk, 0) + INGREDIENT_WEIGHT
+    return RankedRecipes(queryset, ranks)
@@ -1,25 +1,69 @@
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             ShoppingCart, Tag)
 from rest_framework import serializers
 from users.models import Subscribe, User
 
+from .catalog import get_catalog
+from .cook import publish_recipe
+from .images import (StreamingBase64ImageField, get_variant_urls,
+                     schedule_variants)
+from .profiling import ProfiledSerializerMixin
+from .shopping_utils import get_cart_owner_ids, update_cart_totals
 from .validators import (validate_cooking_time, validate_ingredients,
                          validate_tags)
 
 
-class RecipeToRepresentationSerializer(serializers.ModelSerializer):
+def create_or_conflict(create, validated_data, message):
+    """
+    Вставляет строку сразу, без проверки exists(): нарушение
+    уникального ограничения превращается в ошибку валидации.
+    """
+    try:
+        with transaction.atomic():
+            return create(validated_data)
+    except IntegrityError:
+        raise serializers.ValidationError({'errors': message})
+
+
+def get_recipes_limit(request):
+    """ Значение recipes_limit из запроса или None, если не задан. """
+    recipes_limit = request.query_params.get('recipes_limit')
+    if not recipes_limit:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise serializers.ValidationError({
+            'errors': 'recipes_limit должен быть числом'})
+    return recipes_limit
+
+
+class ImageVariantsMixin(serializers.Serializer):
+    """ Ссылки на уменьшенные копии картинки: card, detail, retina. """
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return get_variant_urls(obj, self.context.get('request'))
+
+
+class RecipeToRepresentationSerializer(ImageVariantsMixin,
+                                       serializers.ModelSerializer):
     """ отображения модели Recipe  """
     class Meta:
         model = Recipe
         fields = ('id',
                   'name',
                   'image',
+                  'image_variants',
                   'cooking_time')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(ProfiledSerializerMixin,
+                    serializers.ModelSerializer):
     """ модель Favorite. добавить/удалить список рецов """
     class Meta:
         model = Tag
@@ -29,7 +73,8 @@ class TagSerializer(serializers.ModelSerializer):
                   'slug')
 
 
-class FavoriteRecipeSerializer(serializers.ModelSerializer):
+class FavoriteRecipeSerializer(ProfiledSerializerMixin,
+                               serializers.ModelSerializer):
     """ Ingredient - просмотр списка или конкретного """
     id = serializers.ReadOnlyField(source='recipe.id')
     name = serializers.ReadOnlyField(source='recipe.name')
@@ -47,16 +92,17 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
                             'image',
                             'cooking_time')
 
-    def validate(self, data):
-        user = self.context.get('request').user
-        recipe = self.context.get('recipe')
-        if Favorite.objects.filter(recipe_lover=user, recipe=recipe).exists():
-            raise serializers.ValidationError({
-                'errors': 'Рецепт уже в избранном'})
-        return data
+    def create(self, validated_data):
+        """
+        Повторное добавление отсекает уникальный индекс
+        (recipe_lover, recipe), отдельная проверка не нужна.
+        """
+        return create_or_conflict(
+            super().create, validated_data, 'Рецепт уже в избранном')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(ProfiledSerializerMixin,
+                           serializers.ModelSerializer):
     """
     Сериализатор для работы с моделью Ingredient.
     Используется для просмотра списка или конкретного ингредиента.
@@ -68,7 +114,8 @@ class IngredientSerializer(serializers.ModelSerializer):
                   'measurement_unit')
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ProfiledSerializerMixin,
+                     serializers.ModelSerializer):
     """ работает с User, отображение рецептов в RecipeSerializer."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -82,13 +129,16 @@ class UserSerializer(serializers.ModelSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return user.follower.filter(author=obj).exists()
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(ProfiledSerializerMixin,
+                             serializers.ModelSerializer):
     """ вывели инфу про автора/рецы """
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
@@ -117,20 +167,19 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         """
         QUERY PARAMETERS: recipes_limit - параметр показывает сколько
         рецептов каждого пользователя нужно показать в ответе.
+        В списке подписок рецепты уже подгружены вьюсетом
+        одним запросом на страницу (page_recipes).
         """
-        request = self.context.get('request')
-        recipes = obj.author.recipe.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                raise serializers.ValidationError({
-                    'errors': 'recipes_limit должен быть числом'})
+        recipes = getattr(obj.author, 'page_recipes', None)
+        if recipes is None:
+            recipes = obj.author.recipe.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeToRepresentationSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipe.count()
+        return obj.author.recipes_count
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -144,7 +193,8 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ProfiledSerializerMixin, ImageVariantsMixin,
+                       serializers.ModelSerializer):
     """ функция возвращает сериализованные
     данные ингредиентов в виде списка."""
     author = UserSerializer(read_only=True)
@@ -152,7 +202,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = serializers.SerializerMethodField(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
-    image = Base64ImageField(use_url=True, max_length=None)
+    image = StreamingBase64ImageField(use_url=True)
 
     class Meta:
         model = Recipe
@@ -165,10 +215,13 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time')
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request and not request.user.is_anonymous:
             return Favorite.objects.filter(
@@ -176,6 +229,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request and not request.user.is_anonymous:
             return ShoppingCart.objects.filter(
@@ -183,8 +238,17 @@ class RecipeSerializer(serializers.ModelSerializer):
         return False
 
     def get_ingredients(self, obj):
-        queryset = IngredientInRecipe.objects.filter(recipe=obj)
-        return IngredientInRecipeSerializer(queryset, many=True).data
+        return IngredientInRecipeSerializer(
+            obj.ingredients.all(), many=True).data
+
+    def to_representation(self, instance):
+        """
+        Передаёт автору флаг подписки, посчитанный в запросе вьюсета,
+        чтобы UserSerializer не делал отдельный запрос.
+        """
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
 
     def validate(self, data):
         """
@@ -201,64 +265,113 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise serializers.ValidationError({
                 'ingredients': 'Кажется вы забыли указать ингредиенты'})
-        validate_tags(tags, Tag)
-        validate_ingredients(ingredients, Ingredient)
         validate_cooking_time(cooking_time)
-        data.update({
-            'tags': tags,
-            'ingredients': ingredients,
-            'author': self.context.get('request').user
-        })
+        catalog = get_catalog()
+        errors = {}
+        for field, validator, value in (
+                ('tags', validate_tags, tags),
+                ('ingredients', validate_ingredients, ingredients)):
+            try:
+                data[field] = validator(value, catalog)
+            except ValidationError as error:
+                errors.update(error.message_dict)
+        if errors:
+            raise serializers.ValidationError(errors)
+        data['author'] = self.context.get('request').user
         return data
 
     def create(self, validated_data):
         tags = self.validated_data.pop('tags')
         ingredients = self.validated_data.pop('ingredients')
+        image = self.validated_data.pop('image')
         new_recipe = Recipe.objects.create(
             name=self.validated_data.pop('name'),
-            image=self.validated_data.pop('image'),
+            image=image,
             text=self.validated_data.pop('text'),
             cooking_time=self.validated_data.pop('cooking_time'),
             author=self.validated_data.pop('author'))
-        new_recipe.tags.add(*tags)
-        bulk_create_data = (
+        new_recipe.tags.set(tags)
+        IngredientInRecipe.objects.bulk_create(
             IngredientInRecipe(
                 recipe=new_recipe,
-                ingredient=get_object_or_404(
-                    Ingredient, id=ingredient.get('id')),
-                amount=ingredient.get('amount'))
-            for ingredient in ingredients)
-        IngredientInRecipe.objects.bulk_create(bulk_create_data)
+                ingredient_id=ingredient_id,
+                amount=amount)
+            for ingredient_id, amount in ingredients)
+        image.close()
+        schedule_variants(new_recipe)
+        publish_recipe(new_recipe.pk)
         return new_recipe
 
+    @staticmethod
+    def update_ingredients(recipe, new_amounts):
+        """
+        Приводит ингредиенты рецепта к new_amounts ({id: количество}):
+        изменённые строки обновляются, новые добавляются, лишние
+        удаляются одним запросом. Bulk-операции и _raw_delete не шлют
+        сигналов, поэтому разница по всем строкам одним вызовом
+        переносится в итоги списков покупок, а смена состава один раз
+        записывается в журнал индекса подбора рецептов. Версию рецептов
+        сбрасывает сохранение самого рецепта в update.
+        """
+        changed = []
+        removed = []
+        delta = {}
+        kept = {}
+        for row in IngredientInRecipe.objects.filter(recipe=recipe):
+            if row.ingredient_id not in new_amounts or (
+                    row.ingredient_id in kept):
+                removed.append(row.pk)
+                delta[row.ingredient_id] = (
+                    delta.get(row.ingredient_id, 0) - row.amount)
+                continue
+            kept[row.ingredient_id] = row
+            if row.amount != new_amounts[row.ingredient_id]:
+                delta[row.ingredient_id] = (
+                    delta.get(row.ingredient_id, 0)
+                    + new_amounts[row.ingredient_id] - row.amount)
+                row.amount = new_amounts[row.ingredient_id]
+                changed.append(row)
+        if removed:
+            rows = IngredientInRecipe.objects.filter(pk__in=removed)
+            rows._raw_delete(rows.db)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        created = {pk: amount for pk, amount in new_amounts.items()
+                   if pk not in kept}
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in created.items())
+        delta.update(created)
+        update_cart_totals(get_cart_owner_ids(recipe.pk), delta)
+        if created or removed:
+            publish_recipe(recipe.pk)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         new_tags = self.validated_data.pop('tags')
         new_ingredients = self.validated_data.pop('ingredients')
 
-        instance.image = validated_data.get('image', instance.image)
+        image_changed = 'image' in validated_data
+        if image_changed:
+            instance.image = validated_data['image']
+            instance.image_variants_ready = False
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get(
             'cooking_time', instance.cooking_time)
         instance.save()
+        if image_changed:
+            validated_data['image'].close()
+            schedule_variants(instance)
 
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        bulk_create_data = (
-            IngredientInRecipe(
-                recipe=instance,
-                ingredient=get_object_or_404(
-                    Ingredient, id=ingredient.get('id')),
-                amount=ingredient.get('amount'))
-            for ingredient in new_ingredients)
-        IngredientInRecipe.objects.bulk_create(bulk_create_data)
-
-        instance.tags.clear()
+        self.update_ingredients(instance, dict(new_ingredients))
         instance.tags.set(new_tags)
 
         return instance
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
+class ShoppingCartSerializer(ProfiledSerializerMixin,
+                             serializers.ModelSerializer):
     """
     Сериалайзер для добавления и удаления рецепта из списка покупок.
     Переопределен метод to_representation , чтобы сериализатор
@@ -274,12 +387,12 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         recipe = self.context.get('recipe')
         data['recipe'] = recipe
         data['cart_owner'] = cart_owner
-        if ShoppingCart.objects.filter(cart_owner=cart_owner,
-                                       recipe=recipe).exists():
-            raise serializers.ValidationError({
-                'errors': 'Рецепт уже в списке покупок'})
         return data
 
+    def create(self, validated_data):
+        return create_or_conflict(
+            super().create, validated_data, 'Рецепт уже в списке покупок')
+
     def to_representation(self, instance):
         """
         Метод принимает на вход объект сериализации
@@ -1,21 +1,185 @@
-from django.db.models import Sum
-from recipes.models import IngredientInRecipe, ShoppingCart
+import csv
+import io
+import json
+from itertools import chain
 
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from recipes.models import IngredientInRecipe, ShoppingCart, ShoppingCartTotal
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
-def generate_shopping_list(user):
-    if not ShoppingCart.objects.filter(cart_owner=user).exists():
+PDF_FONT = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+BATCH_SIZE = 500
+
+
+def get_shopping_list(user):
+    """
+    Итератор по строкам списка покупок из таблицы ShoppingCartTotal.
+    Возвращает None, если корзина пуста: первая строка читается сразу,
+    отдельный запрос exists() не нужен.
+    """
+    ingredients = ShoppingCartTotal.objects.filter(
+        cart_owner=user).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'amount').order_by('ingredient__name').iterator()
+    first = next(ingredients, None)
+    if first is None:
         return None
+    return chain((first,), ingredients)
+
+
+def get_recipe_amounts(recipe_id):
+    """ Словарь {id ингредиента: количество} для рецепта. """
+    return dict(IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id).values('ingredient_id').annotate(
+            total=Sum('amount')).values_list('ingredient_id', 'total'))
+
+
+def get_cart_owner_ids(recipe_id):
+    return list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id).values_list('cart_owner_id', flat=True))
+
+
+@transaction.atomic
+def update_cart_totals(owner_ids, amounts):
+    """
+    Прибавляет amounts ({id ингредиента: количество}, можно со знаком
+    минус) к итогам списков покупок пользователей owner_ids.
+    Недостающие строки создаются с нулём, поэтому одновременные
+    добавления не теряют слагаемые; строки с нулём и меньше удаляются.
+    """
+    amounts = {pk: amount for pk, amount in amounts.items() if amount}
+    if not owner_ids or not amounts:
+        return
+    ShoppingCartTotal.objects.bulk_create(
+        (ShoppingCartTotal(cart_owner_id=owner_id, ingredient_id=pk,
+                           amount=0)
+         for owner_id in owner_ids for pk in amounts),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    totals = ShoppingCartTotal.objects.filter(
+        cart_owner_id__in=owner_ids, ingredient_id__in=amounts)
+    totals.update(amount=F('amount') + Case(
+        *(When(ingredient_id=pk, then=Value(amount))
+          for pk, amount in amounts.items()),
+        default=Value(0), output_field=IntegerField()))
+    totals.filter(amount__lte=0).delete()
+
+
+def add_recipe_to_totals(owner_ids, recipe_id, sign=1):
+    """ Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта. """
+    update_cart_totals(owner_ids, {
+        pk: sign * amount
+        for pk, amount in get_recipe_amounts(recipe_id).items()})
+
+
+def get_live_totals():
+    """
+    Итоги списков покупок, посчитанные заново по корзинам:
+    {(id владельца, id ингредиента): количество}.
+    """
+    rows = ShoppingCart.objects.filter(
+        recipe__ingredients__isnull=False).values(
+            'cart_owner_id', 'recipe__ingredients__ingredient_id').annotate(
+                total=Sum('recipe__ingredients__amount')).order_by()
+    return {(row['cart_owner_id'],
+             row['recipe__ingredients__ingredient_id']): row['total']
+            for row in rows.iterator()}
+
 
-    rec_pk = ShoppingCart.objects.filter(
-        cart_owner=user).values('recipe_id')
-    ingredients = IngredientInRecipe.objects.filter(
-        recipe_id__in=rec_pk).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-                amount=Sum('amount')).order_by()
+@transaction.atomic
+def rebuild_cart_totals():
+    """
+    Заменяет содержимое ShoppingCartTotal итогами по корзинам одним
+    INSERT ... SELECT в той же транзакции, что и удаление. На Postgres
+    корзины и ингредиенты рецептов на это время блокируются от записи
+    (чтение не ждёт), чтобы изменения во время пересборки не терялись;
+    SQLite и так пропускает одну пишущую транзакцию.
+    Возвращает число строк итогов.
+    """
+    quote = connection.ops.quote_name
+    totals = quote(ShoppingCartTotal._meta.db_table)
+    carts = quote(ShoppingCart._meta.db_table)
+    items = quote(IngredientInRecipe._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'LOCK TABLE {carts}, {items} IN SHARE MODE')
+        cursor.execute(f'DELETE FROM {totals}')
+        cursor.execute(
+            f'INSERT INTO {totals} (cart_owner_id, ingredient_id, amount) '
+            f'SELECT cart.cart_owner_id, item.ingredient_id, '
+            f'SUM(item.amount) FROM {carts} cart '
+            f'JOIN {items} item ON item.recipe_id = cart.recipe_id '
+            f'GROUP BY cart.cart_owner_id, item.ingredient_id')
+        return cursor.rowcount
 
-    shopping_list = ''
+
+def render_txt(ingredients):
     for item in ingredients:
-        shopping_list += (f'{item["ingredient__name"]}: '
-                          f'{item["amount"]} '
-                          f'{item["ingredient__measurement_unit"]}\n')
-    return shopping_list
+        yield (f'{item["ingredient__name"]}: '
+               f'{item["amount"]} '
+               f'{item["ingredient__measurement_unit"]}\n')
+
+
+class Echo:
+    """ Буфер для csv.writer, который сразу отдаёт записанную строку. """
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    for item in ingredients:
+        yield writer.writerow((item['ingredient__name'],
+                               item['amount'],
+                               item['ingredient__measurement_unit']))
+
+
+def render_json(ingredients):
+    separator = '['
+    for item in ingredients:
+        yield separator + json.dumps({
+            'name': item['ingredient__name'],
+            'amount': item['amount'],
+            'measurement_unit': item['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+def render_pdf(ingredients):
+    """
+    PDF собирается постранично; шрифт с кириллицей берётся
+    из settings.SHOPPING_LIST_FONT.
+    """
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_LIST_FONT))
+    buffer = io.BytesIO()
+    page = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    y = height - PDF_MARGIN
+    page.setFont(PDF_FONT, PDF_FONT_SIZE)
+    for line in render_txt(ingredients):
+        if y < PDF_MARGIN:
+            page.showPage()
+            page.setFont(PDF_FONT, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        page.drawString(PDF_MARGIN, y, line.rstrip('\n'))
+        y -= PDF_FONT_SIZE * 1.5
+    page.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
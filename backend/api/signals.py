@@ -0,0 +1,159 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe, User
+
+from .catalog import bump_catalog_version
+from .cook import publish_recipe
+from .counters import COUNTERS, change_counter
+from .images import change_references
+from .recipe_cache import bump_recipes_version, bump_user_version
+from .search import update_search_vectors
+from .shopping_utils import (add_recipe_to_totals, get_cart_owner_ids,
+                             update_cart_totals)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def catalog_changed(**kwargs):
+    """ Сбрасывает кэш справочников во всех процессах. """
+    bump_catalog_version()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=Subscribe)
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def counted_row_changed(sender, instance, signal, created=False, **kwargs):
+    """ Поддерживает счётчики при добавлении и удалении строк. """
+    if signal is post_save and not created:
+        return
+    for model, field, counted, link in COUNTERS:
+        if counted is sender:
+            change_counter(model, getattr(instance, f'{link}_id'), field,
+                           1 if created else -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def cart_changed(instance, signal, created=False, **kwargs):
+    """
+    Прибавляет рецепт к итогам списка покупок владельца или вычитает.
+    При каскадном удалении рецепта строки корзины и ингредиентов
+    удаляются в любом порядке: что не вычтено здесь (ингредиенты уже
+    удалены), вычел recipe_amount_changed, пока корзина была на месте.
+    """
+    if signal is post_save and not created:
+        return
+    add_recipe_to_totals([instance.cart_owner_id], instance.recipe_id,
+                         1 if created else -1)
+
+
+@receiver(post_init, sender=IngredientInRecipe)
+def remember_amount(instance, **kwargs):
+    """
+    Запоминает ингредиент и количество загруженной строки рецепта,
+    чтобы после сохранения перенести в итоги только разницу.
+    """
+    instance._stored_amount = (instance.__dict__.get('ingredient_id'),
+                               instance.__dict__.get('amount'))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_amount_changed(instance, signal, created=False, **kwargs):
+    """
+    Переносит изменение строки рецепта в итоги списков покупок тех,
+    у кого рецепт в корзине, а смену состава - в журнал индекса
+    подбора рецептов (админка, каскадные удаления).
+    """
+    old_ingredient_id, old_amount = instance._stored_amount
+    if signal is post_delete:
+        delta = {instance.ingredient_id: -instance.amount}
+    else:
+        delta = {}
+        if not created and old_amount is not None:
+            delta[old_ingredient_id] = -old_amount
+        delta[instance.ingredient_id] = (
+            delta.get(instance.ingredient_id, 0) + instance.amount)
+        instance._stored_amount = (instance.ingredient_id, instance.amount)
+    if any(delta.values()):
+        update_cart_totals(get_cart_owner_ids(instance.recipe_id), delta)
+    if (signal is post_delete or created
+            or old_ingredient_id != instance.ingredient_id):
+        publish_recipe(instance.recipe_id)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(instance, **kwargs):
+    """
+    Запоминает имя картинки при загрузке рецепта, чтобы после
+    сохранения понять, сменилась ли она. Отложенное поле не читается.
+    """
+    image = instance.__dict__.get('image')
+    instance._stored_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Recipe)
+def image_saved(instance, created, **kwargs):
+    """ Переносит ссылку со старой картинки рецепта на новую. """
+    if 'image' not in instance.__dict__:
+        return
+    image = instance.image.name or None
+    if created or image != instance._stored_image:
+        change_references(image, 1)
+        if not created:
+            change_references(instance._stored_image, -1)
+    instance._stored_image = image
+
+
+@receiver(post_delete, sender=Recipe)
+def image_released(instance, **kwargs):
+    change_references(instance._stored_image, -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """ Убирает удалённый рецепт из индекса подбора рецептов. """
+    publish_recipe(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipes_changed(**kwargs):
+    """ Сбрасывает ETag и кэш анонимных страниц рецептов. """
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, update_fields=None, **kwargs):
+    """
+    Данные автора входят в ответ и в кэш сериализованных рецептов,
+    вход в систему их не меняет.
+    """
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        Recipe.objects.filter(author=instance).update(
+            updated_at=timezone.now())
+        bump_recipes_version()
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscribe)
+def user_relations_changed(sender, instance, **kwargs):
+    """ Сбрасывает ETag рецептов у владельца избранного, покупок, подписок. """
+    user_field = {Favorite: 'recipe_lover_id', ShoppingCart: 'cart_owner_id',
+                  Subscribe: 'user_id'}[sender]
+    bump_user_version(getattr(instance, user_field))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_text_changed(instance, update_fields=None, **kwargs):
+    """ Пересчитывает поисковый вектор при изменении названия и описания. """
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
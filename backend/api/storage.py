@@ -0,0 +1,39 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранит файл под именем sha256 его содержимого:
+    upload_to/ab/abcd....jpg. Одинаковые загрузки получают одно имя,
+    и файл записывается на диск только один раз. У уже лежащего файла
+    обновляется время изменения: collect_media_garbage --min-age
+    не должен удалить его, пока рецепт с ним ещё не сохранён.
+    """
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        hexdigest = digest.hexdigest()
+        name = os.path.join(
+            directory, hexdigest[:2],
+            hexdigest + os.path.splitext(filename)[1].lower())
+        try:
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            pass
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            return name
+
+    def get_available_name(self, name, max_length=None):
+        """ Имя по хэшу выбирает _save, переименовывать не нужно. """
+        return name
@@ -0,0 +1,95 @@
+from array import array
+
+from django.test import TestCase
+
+from api.cook import CookIndex, CookMatches, set_bits
+from recipes.models import Ingredient, IngredientInRecipe, Recipe
+from users.models import User
+
+
+class CookIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='cook', email='cook@example.com',
+            first_name='Повар', last_name='Поваров')
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'яйца', 'молоко', 'сахар', 'соль')]
+        flour, eggs, milk, sugar, salt = cls.ingredients
+        cls.pancakes = cls.create_recipe('Блины', flour, eggs, milk)
+        cls.omelette = cls.create_recipe('Омлет', eggs, milk, salt)
+        cls.cake = cls.create_recipe('Бисквит', flour, eggs, sugar)
+        cls.boiled = cls.create_recipe('Яйца варёные', eggs)
+
+    @classmethod
+    def create_recipe(cls, name, *ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text=name, cooking_time=10,
+            image='recipes/images/test.png')
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients)
+        return recipe
+
+    def match(self, index, *ingredients, min_coverage=0):
+        matches = CookMatches(index.match(
+            [ingredient.pk for ingredient in ingredients], min_coverage))
+        return [(recipe_id, round(coverage, 2), missing)
+                for recipe_id, coverage, missing in matches[:len(matches)]]
+
+    def test_ranked_by_coverage(self):
+        """ При равном покрытии - больше совпадений, затем новые. """
+        flour, eggs, milk, _, _ = self.ingredients
+        self.assertEqual(self.match(CookIndex(), eggs, milk), [
+            (self.boiled.pk, 1.0, 0),
+            (self.omelette.pk, 0.67, 1),
+            (self.pancakes.pk, 0.67, 1),
+            (self.cake.pk, 0.33, 2),
+        ])
+
+    def test_min_coverage_and_pages(self):
+        flour, eggs, milk, _, _ = self.ingredients
+        matches = CookMatches(CookIndex().match(
+            [flour.pk, eggs.pk, milk.pk], 0.5))
+        self.assertEqual(len(matches), 4)
+        self.assertEqual([match[0] for match in matches[1:3]],
+                         [self.boiled.pk, self.cake.pk])
+        self.assertEqual(self.match(
+            CookIndex(), flour, eggs, milk, min_coverage=1), [
+                (self.pancakes.pk, 1.0, 0), (self.boiled.pk, 1.0, 0)])
+
+    def test_unknown_ingredient(self):
+        self.assertEqual(CookIndex().match([10 ** 6]), [])
+
+    def test_sorted_array_and_bitset_agree(self):
+        index = CookIndex()
+        flour, eggs, milk, _, _ = self.ingredients
+        expected = self.match(index, flour, eggs, milk)
+        for ingredient in (flour, eggs, milk):
+            posting = index.postings[ingredient.pk]
+            if isinstance(posting, int):
+                index.postings[ingredient.pk] = array('I', (
+                    recipe_id for recipe_id in range(len(index.sizes))
+                    if posting >> recipe_id & 1))
+            else:
+                index.postings[ingredient.pk] = set_bits(
+                    posting, len(index.sizes))
+        self.assertEqual(self.match(index, flour, eggs, milk), expected)
+
+    def test_sync_applies_changes(self):
+        index = CookIndex()
+        flour, eggs, milk, sugar, _ = self.ingredients
+        IngredientInRecipe.objects.filter(
+            recipe=self.pancakes, ingredient=milk).delete()
+        IngredientInRecipe.objects.create(
+            recipe=self.boiled, ingredient=sugar, amount=1)
+        self.cake.delete()
+        pie = self.create_recipe('Пирог', flour, eggs)
+        IngredientInRecipe.objects.create(
+            recipe=pie, ingredient=sugar, amount=1)
+        self.assertTrue(index.sync())
+        self.assertEqual(self.match(index, flour, eggs),
+                         self.match(CookIndex(), flour, eggs))
+        self.assertEqual(self.match(index, flour, eggs)[0],
+                         (self.pancakes.pk, 1.0, 0))
@@ -0,0 +1,38 @@
+from django.test import TestCase
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscribe, User
+
+
+class CounterFieldsTest(TestCase):
+    """ Полное сохранение не затирает счётчики, изменённые сигналами. """
+    def setUp(self):
+        self.author = User.objects.create(
+            username='author', email='author@foodgram.ru',
+            first_name='Автор', last_name='Рецептов')
+        self.reader = User.objects.create(
+            username='reader', email='reader@foodgram.ru',
+            first_name='Читатель', last_name='Рецептов')
+
+    def test_user_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Recipe.objects.create(
+            author=self.author, name='Суп', text='Суп', cooking_time=5)
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        stale.first_name = 'Повар'
+        stale.save()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.first_name, 'Повар')
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_recipe_save_keeps_counters(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Суп', text='Суп', cooking_time=5)
+        stale = Recipe.objects.get(pk=recipe.pk)
+        Favorite.objects.create(recipe_lover=self.reader, recipe=recipe)
+        stale.text = 'Густой суп'
+        stale.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.text, 'Густой суп')
+        self.assertEqual(recipe.favorites_count, 1)
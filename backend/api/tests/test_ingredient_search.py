@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+
+from api.ingredient_search import IngredientIndex
+
+NAMES = (
+    'сахар', 'сахар ванильный', 'сахар коричневый', 'сухари панировочные',
+    'мука', 'мука ржаная', 'молоко', 'молоко 3,2%', 'алкоголь',
+    'макаронные изделия', 'соль', 'соль морская', 'фасоль', 'картофель',
+    'картофель молодой', 'яблоки',
+)
+
+
+class IngredientIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = IngredientIndex(
+            (pk, name, 'г') for pk, name in enumerate(NAMES, 1))
+
+    def search(self, query, limit=5):
+        return [item['name'] for item in self.index.search(query, limit)]
+
+    def test_exact_then_prefix_then_substring(self):
+        self.assertEqual(self.search('соль'),
+                         ['соль', 'соль морская', 'фасоль'])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search('с', 2)), 2)
+        self.assertEqual(self.search('', 3), ['алкоголь', 'картофель',
+                                              'картофель молодой'])
+
+    def test_one_typo_in_short_word(self):
+        self.assertEqual(self.search('сохар', 3),
+                         ['сахар', 'сахар ванильный', 'сахар коричневый'])
+        self.assertEqual(self.search('мукаа', 2), ['мука', 'мука ржаная'])
+
+    def test_two_typos_prefer_closer_length(self):
+        self.assertEqual(self.search('малако', 2), ['молоко', 'молоко 3,2%'])
+
+    def test_typo_in_long_word(self):
+        self.assertEqual(self.search('картошель', 2),
+                         ['картофель', 'картофель молодой'])
+
+    def test_typos_rank_below_prefix(self):
+        self.assertEqual(self.search('сахар')[:3],
+                         ['сахар', 'сахар ванильный', 'сахар коричневый'])
+        self.assertNotIn('сухари панировочные', self.search('сахар', 3))
+
+    def test_typos_in_every_word(self):
+        self.assertEqual(self.search('сахр коричнев'), ['сахар коричневый'])
+
+    def test_very_short_word_has_no_typos(self):
+        self.assertEqual(self.search('яб'), ['яблоки'])
+        self.assertEqual(self.search('юб'), [])
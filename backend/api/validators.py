@@ -1,43 +1,78 @@
 import re
+from collections import Counter
 
 from django.core.exceptions import ValidationError
 
 
-def validate_ingredients(ingredients_list, val_model):
+def get_catalog_pk(value):
+    """ Приводит число из запроса к int, для неверных значений None. """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def validate_ingredients(ingredients_list, catalog):
     """
-    Проверяет список ингредиентов на наличие дубликатов и  заполнение.
-    :param ingredients: список словарей, содержащих данные в ингредиентах.
-    :param ingredient_model: модель ингредиента, используемая в приложении.
+    Проверяет список ингредиентов целиком и сообщает обо всех
+    ошибках сразу: пустые и несуществующие id, дубликаты, количество.
+    :param ingredients_list: список словарей с id и amount.
+    :param catalog: кэш справочников (api.catalog.Catalog).
+    :return: список пар (id ингредиента, количество).
     """
     if len(ingredients_list) < 1:
-        raise ValidationError(
-            'Блюдо должно содержать хотя бы 1 ингредиент')
-    unique_list = []
+        raise ValidationError({
+            'ingredients': 'Блюдо должно содержать хотя бы 1 ингредиент'})
+    errors = []
+    resolved = []
     for ingredient in ingredients_list:
-        if not ingredient.get('id'):
-            raise ValidationError('Укажите id ингредиента')
-        ingredient_id = ingredient.get('id')
-        if not val_model.objects.filter(pk=ingredient_id).exists():
-            raise ValidationError(
-                f'{ingredient_id}- ингредиент с таким id не найден')
-        if id in unique_list:
-            raise ValidationError(
-                f'{ingredient_id}- дублирующийся ингредиент')
-        unique_list.append(ingredient_id)
-        ingredient_amount = ingredient.get('amount')
-        if int(ingredient_amount) < 1:
-            raise ValidationError(
-                f'Количество {ingredient} должно быть больше 1')
-
-
-def validate_tags(tags_list, val_model):
+        ingredient_id = get_catalog_pk(ingredient.get('id'))
+        amount = get_catalog_pk(ingredient.get('amount'))
+        if ingredient_id is None:
+            errors.append(f'Укажите id ингредиента: {ingredient}')
+            continue
+        if amount is None or amount < 1:
+            errors.append(
+                f'Количество ингредиента {ingredient_id} '
+                f'должно быть больше 0')
+            continue
+        resolved.append((ingredient_id, amount))
+    ids = [ingredient_id for ingredient_id, _ in resolved]
+    missing = catalog.find_missing_ingredients(ids)
+    if missing:
+        errors.append(f'{", ".join(map(str, missing))} - ингредиенты '
+                      f'с такими id не найдены')
+    duplicates = sorted(pk for pk, count in Counter(ids).items() if count > 1)
+    if duplicates:
+        errors.append(f'{", ".join(map(str, duplicates))} - '
+                      f'дублирующиеся ингредиенты')
+    if errors:
+        raise ValidationError({'ingredients': errors})
+    return resolved
+
+
+def validate_tags(tags_list, catalog):
     """
-    Проверяет корректность указанного времени приготовления.
-    :param cooking_time: время приготовления в минутах.
+    Проверяет, что все указанные тэги есть в справочнике и не повторяются.
+    :param tags_list: список id тэгов.
+    :param catalog: кэш справочников (api.catalog.Catalog).
+    :return: список id тэгов.
     """
-    for tag in tags_list:
-        if not val_model.objects.filter(pk=tag).exists():
-            raise ValidationError(f'{tag} - Такого тэга нет')
+    errors = []
+    ids = [get_catalog_pk(tag) for tag in tags_list]
+    invalid = [tag for tag, pk in zip(tags_list, ids) if pk is None]
+    ids = [pk for pk in ids if pk is not None]
+    missing = invalid + catalog.find_missing_tags(ids)
+    if missing:
+        errors.append(
+            f'{", ".join(map(str, missing))} - Таких тэгов нет')
+    duplicates = sorted(pk for pk, count in Counter(ids).items() if count > 1)
+    if duplicates:
+        errors.append(
+            f'{", ".join(map(str, duplicates))} - дублирующиеся тэги')
+    if errors:
+        raise ValidationError({'tags': errors})
+    return ids
 
 
 def validate_cooking_time(value):
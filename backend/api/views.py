@@ -1,4 +1,9 @@
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
@@ -6,21 +11,28 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from recipes.models import (Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Tag)
 from users.models import Subscribe, User
 
-from .shopping_utils import generate_shopping_list
-from .filters import SearchFilterIngr, RecipeFilter
-from .mixins import CreateDestroyAll
-from .paginators import PageNumPagination
+from .catalog import get_or_404
+from .cook import find_recipes
+from .filters import RecipeFilter
+from .mixins import (CatalogCacheMixin, CreateDestroyAll, RecipeCacheMixin,
+                     RecipeFragmentMixin)
+from .negotiation import IgnoreFormatContentNegotiation
+from .paginators import PageNumPagination, RankedPagination
 from .permissions import IsAuthorOrReadOnly
 from .serializers import (FavoriteRecipeSerializer, IngredientSerializer,
                           RecipeSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, TagSerializer)
+                          SubscriptionSerializer, TagSerializer,
+                          get_recipes_limit)
+from .shopping_utils import SHOPPING_LIST_FORMATS, get_shopping_list
+from .validators import get_catalog_pk
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeCacheMixin, RecipeFragmentMixin,
+                    viewsets.ModelViewSet):
     """
     viewset для работы с моделью Recipe.
     Он наследуется от ModelViewSet,
@@ -32,30 +44,141 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     pagination_class = PageNumPagination
+    cursor_ordering = ('-pub_date', '-id')
+    fragment_actions = ('list', 'retrieve', 'cook')
+
+    def get_queryset(self):
+        """
+        Флаги is_favorited и is_in_shopping_cart считаются
+        подзапросами EXISTS в основном запросе, а не по рецепту.
+        Для чтения автор, тэги и ингредиенты подгружаются заранее,
+        поэтому страница рецептов стоит фиксированное число запросов;
+        флаги при чтении берёт RecipeFragmentMixin из кэша пользователя.
+        """
+        user = self.request.user
+        if user.is_anonymous or self.action in self.fragment_actions:
+            false = Value(False, output_field=BooleanField())
+            queryset = Recipe.objects.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_is_subscribed=false)
+        else:
+            queryset = Recipe.objects.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    recipe=OuterRef('pk'), recipe_lover=user)),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    recipe=OuterRef('pk'), cart_owner=user)),
+                author_is_subscribed=Exists(Subscribe.objects.filter(
+                    author=OuterRef('author'), user=user)))
+        if self.action in self.fragment_actions:
+            queryset = queryset.select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'ingredients',
+                    queryset=IngredientInRecipe.objects.select_related(
+                        'ingredient')))
+        return queryset
+
+    @action(detail=False, url_path='cook', pagination_class=RankedPagination)
+    def cook(self, request):
+        """
+        Что можно приготовить из имеющихся ингредиентов.
+        QUERY PARAMETERS: ingredients - id ингредиентов (повторяется
+        или через запятую), min_coverage - наименьшая доля ингредиентов
+        рецепта, которые есть (от 0 до 1), limit и page.
+        Рецепты идут по убыванию этой доли (coverage), в ответе
+        также missing_ingredients - сколько ингредиентов недостаёт.
+        """
+        values = [value for values in request.query_params.getlist(
+            'ingredients') for value in values.split(',') if value]
+        ingredient_ids = {get_catalog_pk(value) for value in values}
+        if not ingredient_ids or None in ingredient_ids:
+            return Response(
+                {'errors': 'Укажите id ингредиентов в ingredients'},
+                status=status.HTTP_400_BAD_REQUEST)
+        if len(ingredient_ids) > settings.COOK_MAX_INGREDIENTS:
+            return Response(
+                {'errors': f'Не больше {settings.COOK_MAX_INGREDIENTS} '
+                           f'ингредиентов'},
+                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            min_coverage = float(request.query_params.get('min_coverage', 0))
+        except ValueError:
+            min_coverage = -1
+        if not 0 <= min_coverage <= 1:
+            return Response(
+                {'errors': 'min_coverage должен быть числом от 0 до 1'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(
+            find_recipes(ingredient_ids, min_coverage))
+        recipes = self.queryset.only(*self.fragment_fields).in_bulk(
+            [recipe_id for recipe_id, *_ in page])
+        ranks = {recipe_id: (coverage, missing)
+                 for recipe_id, coverage, missing in page}
+        results = []
+        for fragment in self.render_fragments(
+                recipes[recipe_id] for recipe_id, *_ in page
+                if recipe_id in recipes):
+            coverage, missing = ranks[fragment['id']]
+            results.append({**fragment, 'coverage': round(coverage, 3),
+                            'missing_ingredients': missing})
+        return self.get_paginated_response(results)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     viewset для работы с моделью Tag.
     Он наследуется от ReadOnlyModelViewSet,
     предоставляет только операции чтения для модели Tag.
+    Данные берутся из кэша справочников, а не из базы.
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.get_catalog_response(
+            request, lambda catalog: catalog.tag_list)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    def retrieve(self, request, pk=None):
+        return self.get_catalog_response(
+            request, lambda catalog: get_or_404(catalog.get_tag, pk))
+
+
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     используется для создания представления API,
     которое обеспечивает только чтение (read-only)
-    операций для модели Ingredient
+    операций для модели Ingredient.
+    QUERY PARAMETERS: name (или ingredient_name) - поиск по названию,
+    limit - сколько подсказок вернуть, не больше INGREDIENT_SEARCH_LIMIT.
+    Данные берутся из кэша справочников, а не из базы.
     """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (SearchFilterIngr,)
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        query = (request.query_params.get('name')
+                 or request.query_params.get('ingredient_name'))
+        if not query:
+            return self.get_catalog_response(
+                request, lambda catalog: catalog.ingredient_list)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.INGREDIENT_SEARCH_LIMIT))
+        except ValueError:
+            return Response({'errors': 'limit должен быть числом'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.INGREDIENT_SEARCH_LIMIT))
+        return self.get_catalog_response(
+            request,
+            lambda catalog: catalog.ingredient_index.search(query, limit))
+
+    def retrieve(self, request, pk=None):
+        return self.get_catalog_response(
+            request, lambda catalog: get_or_404(catalog.get_ingredient, pk))
 
 
 class SubscriptionsViewSet(viewsets.ModelViewSet):
@@ -69,8 +192,22 @@ class SubscriptionsViewSet(viewsets.ModelViewSet):
     pagination_class = PageNumPagination
 
     def get_queryset(self):
+        """
+        Автор подтягивается JOIN-ом, а рецепты всех авторов страницы -
+        одним запросом: при recipes_limit каждый автор ограничен
+        коррелированным подзапросом с LIMIT по порядку Recipe.Meta.
+        """
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'image_variants_ready',
+            'cooking_time', 'pub_date')
+        recipes_limit = get_recipes_limit(self.request)
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(Recipe.objects.filter(
+                author=OuterRef('author')).values('pk')[:recipes_limit]))
         return Subscribe.objects.filter(
-            user=self.request.user).prefetch_related('author')
+            user=self.request.user).select_related('author').prefetch_related(
+                Prefetch('author__recipe', queryset=recipes,
+                         to_attr='page_recipes'))
 
 
 class SubscribeCreateView(APIView):
@@ -90,10 +227,11 @@ class SubscribeCreateView(APIView):
                 'errors': 'Вы не можете подписаться на самого себя'},
                 status=status.HTTP_400_BAD_REQUEST)
 
-        subscription, created = Subscribe.objects.get_or_create(
-            author=author, user=request.user)
-
-        if not created:
+        try:
+            with transaction.atomic():
+                subscription = Subscribe.objects.create(
+                    author=author, user=request.user)
+        except IntegrityError:
             return Response({'errors': 'Вы уже подписаны на этого автора'},
                             status=status.HTTP_400_BAD_REQUEST)
 
@@ -102,10 +240,10 @@ class SubscribeCreateView(APIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, author_id):
-        author = get_object_or_404(User, id=author_id)
-        subscription = get_object_or_404(
-            Subscribe, author=author, user=request.user)
-        subscription.delete()
+        deleted, _ = Subscribe.objects.filter(
+            author_id=author_id, user=request.user).delete()
+        if not deleted:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -131,16 +269,11 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 
     @action(methods=('delete',), detail=True)
     def delete(self, request, recipe_id):
-        recipe = self.kwargs.get('recipe_id')
-        recipe_lover = self.request.user
-        if not Favorite.objects.filter(recipe=recipe,
-                                       recipe_lover=recipe_lover).exists():
+        deleted, _ = Favorite.objects.filter(
+            recipe=recipe_id, recipe_lover=request.user).delete()
+        if not deleted:
             return Response({'errors': 'Рецепт не в избранном'},
                             status=status.HTTP_400_BAD_REQUEST)
-        get_object_or_404(
-            Favorite,
-            recipe_lover=recipe_lover,
-            recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -166,32 +299,38 @@ class ShoppingCartViewSet(CreateDestroyAll):
 
     @action(methods=('delete',), detail=True)
     def delete(self, request, recipe_id):
-        recipe = self.kwargs.get('recipe_id')
-        cart_owner = self.request.user
-        if not ShoppingCart.objects.filter(recipe=recipe,
-                                           cart_owner=cart_owner).exists():
+        deleted, _ = ShoppingCart.objects.filter(
+            recipe=recipe_id, cart_owner=request.user).delete()
+        if not deleted:
             return Response({'errors': 'Рецепт не добавлен в список покупок'},
                             status=status.HTTP_400_BAD_REQUEST)
-        get_object_or_404(
-            ShoppingCart,
-            cart_owner=cart_owner,
-            recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class DownloadShoppingCart(APIView):
     """
-    скачивание списка покупок в виде текстового файла
+    скачивание списка покупок в виде файла.
+    QUERY PARAMETERS: format - txt (по умолчанию), csv, json или pdf.
+    Файл отдаётся потоком по мере чтения строк из базы.
     """
     permission_classes = [IsAuthenticated, ]
+    content_negotiation_class = IgnoreFormatContentNegotiation
 
     def get(self, request):
-        shopping_list = generate_shopping_list(request.user)
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Доступные форматы: '
+                           + ', '.join(SHOPPING_LIST_FORMATS)},
+                status=status.HTTP_400_BAD_REQUEST)
+        shopping_list = get_shopping_list(request.user)
         if shopping_list is None:
             return Response({'errors': 'В вашем списке покупок ничего нет'},
                             status=status.HTTP_400_BAD_REQUEST)
 
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        filename = 'shopping_list.txt'
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(shopping_list), content_type=content_type)
+        filename = f'shopping_list.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -0,0 +1,33 @@
+"""
+ASGI config for foodgram project.
+
+Django 2.2 не умеет ASGI сам, поэтому приложение Django работает через
+asgiref.wsgi.WsgiToAsgi (в пуле потоков), а чтение справочников,
+анонимных страниц рецептов из кэша и скачивание списка покупок
+обрабатывает асинхронный api.asgi.AsyncReadRouter.
+
+Запуск: gunicorn foodgram.asgi:application -c gunicorn.conf.py
+-k uvicorn.workers.UvicornWorker
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+django_application = get_wsgi_application()
+
+from api.asgi import AsyncReadRouter  # noqa: E402
+from api.catalog import get_catalog  # noqa: E402
+from api.cook import get_cook_index  # noqa: E402
+
+application = AsyncReadRouter(WsgiToAsgi(django_application))
+
+try:
+    get_catalog()
+    get_cook_index()
+except DatabaseError:
+    pass
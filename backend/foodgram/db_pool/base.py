@@ -0,0 +1,110 @@
+"""
+Бэкенд PostgreSQL с пулом соединений в процессе (ENGINE=foodgram.db_pool).
+Нужен для потоковых воркеров gunicorn (gthread): Django закрывает
+соединение в конце запроса, а бэкенд возвращает его в пул, откуда
+его берёт следующий запрос любого потока. Размер пула задают
+DB_POOL_MIN_SIZE и DB_POOL_MAX_SIZE; он должен быть не меньше
+числа потоков воркера. Когда все соединения заняты, запрос ждёт
+свободное до DB_POOL_TIMEOUT секунд и только потом получает ошибку.
+"""
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.db.backends.postgresql import base
+from psycopg2 import extensions, pool
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    """
+    Пул, в котором новые соединения открывает connect - get_new_connection
+    бэкенда Django со всей его настройкой соединения. getconn при
+    занятом пуле ждёт освободившееся соединение до timeout секунд,
+    а не сразу бросает PoolError.
+    """
+    def __init__(self, minconn, maxconn, connect, timeout):
+        self.connect = connect
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn)
+
+    def _connect(self, key=None):
+        """ Как в psycopg2, только соединение открывает connect. """
+        connection = self.connect()
+        if key is not None:
+            self._used[key] = connection
+            self._rused[id(connection)] = key
+        else:
+            self._pool.append(connection)
+        return connection
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f'Все соединения пула заняты дольше {self.timeout} с')
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_pool(self, conn_params):
+        with _lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = ConnectionPool(
+                    settings.DB_POOL_MIN_SIZE, settings.DB_POOL_MAX_SIZE,
+                    partial(super().get_new_connection, conn_params),
+                    settings.DB_POOL_TIMEOUT)
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        """
+        Соединение из пула. Новые соединения настраивает родительский
+        get_new_connection, здесь остаётся запомнить их уровень изоляции.
+        """
+        connections = self.get_pool(conn_params)
+        connection = connections.getconn()
+        if settings.DB_CONN_HEALTH_CHECKS and not self.ping(connection):
+            connections.putconn(connection, close=True)
+            connection = connections.getconn()
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    @staticmethod
+    def ping(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def _close(self):
+        """ Возвращает соединение в пул вместо закрытия. """
+        if self.connection is None:
+            return
+        connection = self.connection
+        broken = bool(connection.closed)
+        if not broken and (connection.get_transaction_status()
+                           != extensions.TRANSACTION_STATUS_IDLE):
+            try:
+                connection.rollback()
+            except base.Database.Error:
+                broken = True
+        _pools[self.alias].putconn(connection, close=broken)
@@ -0,0 +1,32 @@
+"""
+Бэкенд PostgreSQL с проверкой сохранённых соединений
+(ENGINE=foodgram.postgresql). Соединение, пережившее запрос
+(CONN_MAX_AGE), проверяется не в начале каждого запроса, а при первом
+обращении к базе в запросе: запросы без базы обходятся без SELECT 1.
+Оборванное базой соединение закрывается и открывается заново.
+Проверку отключает DB_CONN_HEALTH_CHECKS=False.
+"""
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    health_check_done = True
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        """ Вызывается Django в начале и в конце запроса. """
+        self.health_check_done = True
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = not settings.DB_CONN_HEALTH_CHECKS
+
+    def ensure_connection(self):
+        if (not self.health_check_done and self.connection is not None
+                and not self.in_atomic_block):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -1,4 +1,5 @@
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -25,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.profiling.QueryProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,14 +62,66 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
+        # foodgram.postgresql - PostgreSQL с проверкой соединений
+        # при первом обращении к базе в запросе (DB_CONN_HEALTH_CHECKS).
+        'ENGINE': os.getenv('DB_ENGINE', 'foodgram.postgresql'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Соединение живёт между запросами воркера; с пулом
+        # (DB_ENGINE=foodgram.db_pool) ставьте 0, чтобы оно
+        # возвращалось в пул в конце запроса.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     }
 }
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+# Сколько секунд ждать свободное соединение, когда пул занят.
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+# В default лежат страницы и сериализованные рецепты: при переполнении
+# их можно вытеснять. Это общий для всех воркеров memcached
+# из MEMCACHED_LOCATION (host:port через запятую, в docker-compose -
+# сервис memcached). Без него - файловый кэш для разработки: в Django 2.2
+# каждый его set перебирает весь каталог, и запись дорожает с ростом кэша.
+# Версии (ETag, справочники) хранятся в versions: ключ на пользователя,
+# запись при каждом изменении избранного, покупок и подписок, поэтому
+# в production это тоже memcached (запись O(1)), при желании отдельный
+# (VERSION_MEMCACHED_LOCATION), чтобы страницы не вытесняли версии.
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.getenv(
+                'VERSION_MEMCACHED_LOCATION', MEMCACHED_LOCATION).split(','),
+            'KEY_PREFIX': 'versions',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv(
+                'CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+            },
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('VERSION_CACHE_LOCATION',
+                                  os.path.join(BASE_DIR, '.versions')),
+            'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+        },
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -136,9 +190,36 @@ USER_MAX_LENGTH = 150
 EMAIL_MAX_LENGTH = 254
 TAG_MAX_LENGTH = 200
 INGREDIENT_MAX_LENGTH = 900
+INGREDIENT_SEARCH_LIMIT = 50
+CATALOG_CACHE_MAX_AGE = 60
+MAX_PAGE_SIZE = 100
+RECIPE_PAGE_CACHE_TIMEOUT = 300
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
+COOK_MAX_INGREDIENTS = 100
+RECIPE_IMAGE_MAX_SIZE = 8000
+RECIPE_IMAGE_VARIANTS = {'card': 480, 'detail': 1024, 'retina': 2048}
+RECIPE_IMAGE_QUALITY = 80
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', 'False') == 'True'
+QUERY_PROFILING_SAMPLE_RATE = float(
+    os.getenv('QUERY_PROFILING_SAMPLE_RATE', 1))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
@@ -10,7 +10,19 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+# Справочники тэгов и ингредиентов и индекс подбора рецептов
+# собираются при старте воркера, а не на первом запросе.
+from api.catalog import get_catalog  # noqa: E402
+from api.cook import get_cook_index  # noqa: E402
+
+try:
+    get_catalog()
+    get_cook_index()
+except DatabaseError:
+    pass
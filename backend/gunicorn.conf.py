@@ -0,0 +1,31 @@
+# Настройки gunicorn из переменных окружения. Без переменных остаются
+# значения gunicorn по умолчанию: один sync-воркер без перезапусков.
+# GUNICORN_WORKER_CLASS: sync, gthread (потоки), gevent (нужны пакеты
+# gevent и psycogreen) или uvicorn.workers.UvicornWorker
+# для foodgram.asgi:application.
+# Каждый воркер - отдельный процесс со своими справочниками, индексами
+# поиска и подбора рецептов в памяти: около 90 МБ на небольшой базе
+# и больше с ростом числа рецептов и ингредиентов. GUNICORN_WORKERS
+# выбирается по памяти сервера, а не только по числу ядер.
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 2))
+# 0 - воркеры не перезапускаются и не собирают индексы заново.
+# Перезапуск после N запросов ограничивает рост памяти, разброс -
+# чтобы воркеры не перезапускались одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # Без этого psycopg2 блокирует весь процесс на время запроса.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -18,7 +18,9 @@ class RecipeIngredientInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientInline, )
-    list_display = ('id', 'name', 'author')
+    list_display = ('id', 'name', 'author',
+                    'favorites_count', 'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     list_filter = ('name', 'author', 'tags',)
 
 
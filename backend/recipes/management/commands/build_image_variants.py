@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии картинок рецептов, для которых '
+            'их ещё нет (старые рецепты, загрузка через админку, сбои пула)')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.filter(image_variants_ready=False).exclude(
+            image='').exclude(image__isnull=True).values_list('pk', 'image')
+        count = 0
+        for recipe_id, image_name in recipes.iterator():
+            process_recipe_image(recipe_id, image_name)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {count}'))
@@ -0,0 +1,81 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from api.images import VARIANTS_DIR
+from recipes.models import MediaFile, Recipe
+
+BATCH_SIZE = 500
+
+
+def iter_files(storage, directory):
+    """ Обходит каталог хранилища, не собирая список файлов целиком. """
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from iter_files(storage, os.path.join(directory, name))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки рецептов, на которые не ссылается ни один '
+            'рецепт, вместе с их уменьшенными копиями')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено')
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Не трогать файлы моложе стольких минут: рецепт с ними '
+                 'может быть ещё не сохранён')
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        directory = field.upload_to.rstrip('/')
+        if not storage.exists(directory):
+            self.stdout.write('Картинок нет')
+            return
+        deadline = time.time() - options['min_age'] * 60
+        checked = removed = 0
+        for batch in batches(iter_files(storage, directory), BATCH_SIZE):
+            checked += len(batch)
+            used = set(MediaFile.objects.filter(
+                name__in=batch, references__gt=0).values_list(
+                    'name', flat=True))
+            used.update(Recipe.objects.filter(image__in=batch).values_list(
+                'image', flat=True))
+            orphans = [
+                name for name in batch if name not in used
+                and os.path.getmtime(storage.path(name)) < deadline]
+            for name in orphans:
+                self.stdout.write(f'удаляется {name}')
+                if not options['dry_run']:
+                    self.delete(storage, name)
+            if not options['dry_run']:
+                MediaFile.objects.filter(name__in=orphans).delete()
+            removed += len(orphans)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {checked}, без ссылок: {removed}'))
+
+    @staticmethod
+    def delete(storage, name):
+        storage.delete(name)
+        stem = os.path.splitext(os.path.basename(name))[0]
+        variants = f'{VARIANTS_DIR}/{stem}'
+        if storage.exists(variants):
+            for variant in storage.listdir(variants)[1]:
+                storage.delete(f'{variants}/{variant}')
+            os.rmdir(storage.path(variants))
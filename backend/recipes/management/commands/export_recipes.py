@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api.recipe_transfer import export_recipes
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты с ингредиентами, тэгами и ссылками '
+            'на картинки в NDJSON (по рецепту в строке)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Рецептов в одном запросе')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            output = sys.stdout
+        else:
+            output = open(options['path'], 'w', encoding='utf-8')
+        count = 0
+        try:
+            for line in export_recipes(options['batch_size']):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {count}'))
@@ -1,33 +1,63 @@
-import csv
+import os
+import time
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
-from recipes.models import Ingredient
+from api.catalog import bump_catalog_version
+from api.ingredient_import import (ImportRowError, import_ingredients,
+                                   read_csv, read_json)
+
+READERS = {'csv': read_csv, 'json': read_json}
 
 
 class Command(BaseCommand):
-    help = 'Import data from data/ingredients.csv'
+    help = ('Загружает ингредиенты из CSV или JSON (по умолчанию '
+            'data/ingredients.csv): новые добавляет, у существующих '
+            'обновляет написание, повторы пропускает')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data',
+                                 'ingredients.csv'),
+            help='Файл с ингредиентами')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Строк в одной транзакции')
 
     def handle(self, *args, **options):
-        try:
-            with open(f'{settings.BASE_DIR}/data/ingredients.csv',
-                      'r', encoding='utf-8') as ing_file:
-                reader = csv.reader(ing_file, delimiter=',')
-                upload_list = []
-                for row in reader:
-                    name, measurement_unit = row
-                    newby = Ingredient(
-                        name=name,
-                        measurement_unit=measurement_unit)
-                    if newby not in upload_list:
-                        upload_list.append(newby)
-                Ingredient.objects.bulk_create(upload_list)
-                self.stdout.write(
-                    self.style.SUCCESS('Ингредиенты загружены успешно'))
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла {path}, укажите --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
 
+        def report_error(number, error):
+            self.stderr.write(f'Запись {number} пропущена: {error}')
+
+        started = time.monotonic()
+        try:
+            with open(path, 'r', encoding='utf-8', newline='') as file:
+                counts = import_ingredients(
+                    READERS[file_format](file), options['batch_size'],
+                    on_error=report_error)
         except FileNotFoundError:
-            self.stdout.write(
-                self.style.ERROR('Упс, что-то пошло не так...'))
-            raise CommandError(
-                f'В директории {settings.BASE_DIR}/data отсутствует файл')
+            raise CommandError(f'Файл {path} не найден')
+        except (ImportRowError, UnicodeDecodeError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        if counts['inserted'] or counts['updated']:
+            bump_catalog_version()
+        elapsed = time.monotonic() - started
+        total = sum(counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            'Ингредиенты загружены: добавлено {inserted}, обновлено '
+            '{updated}, пропущено {skipped}'.format(**counts)
+            + f' ({total} строк за {elapsed:.2f} с, '
+            f'{total / max(elapsed, 1e-9):.0f} строк/с)'))
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.recipe_transfer import RecipeImporter
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из NDJSON, выгруженного export_recipes. '
+            'Авторы, тэги и ингредиенты должны уже быть в базе, файлы '
+            'картинок - в хранилище')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл с рецептами, по умолчанию stdin')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Рецептов в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0')
+
+        def report_error(number, error):
+            self.stderr.write(f'Строка {number} пропущена: {error}')
+
+        started = time.monotonic()
+        importer = RecipeImporter(on_error=report_error)
+        if options['path'] == '-':
+            counts = importer.import_lines(sys.stdin, options['batch_size'])
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as file:
+                    counts = importer.import_lines(
+                        file, options['batch_size'])
+            except FileNotFoundError:
+                raise CommandError(f'Файл {options["path"]} не найден')
+        self.stdout.write(self.style.SUCCESS(
+            'Рецептов загружено: {imported}, пропущено: {skipped}'.format(
+                **counts)
+            + f' за {time.monotonic() - started:.2f} с'))
+        if counts['imported']:
+            self.stdout.write(
+                'Уменьшенные копии картинок строит build_image_variants')
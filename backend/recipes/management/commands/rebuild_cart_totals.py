@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.shopping_utils import get_live_totals, rebuild_cart_totals
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает таблицу итогов списков покупок по корзинам '
+            'или сверяет её с живой агрегацией (--check)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить таблицу, ничего не меняя')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            live = get_live_totals()
+            stored = {
+                (owner_id, ingredient_id): amount
+                for owner_id, ingredient_id, amount
+                in ShoppingCartTotal.objects.values_list(
+                    'cart_owner_id', 'ingredient_id', 'amount').iterator()}
+            diff = [key for key in live.keys() | stored.keys()
+                    if live.get(key) != stored.get(key)]
+            if diff:
+                for owner_id, ingredient_id in sorted(diff)[:20]:
+                    self.stdout.write(
+                        f'пользователь {owner_id}, ингредиент '
+                        f'{ingredient_id}: в таблице '
+                        f'{stored.get((owner_id, ingredient_id))}, '
+                        f'по корзинам {live.get((owner_id, ingredient_id))}')
+                raise CommandError(f'Расхождений: {len(diff)}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги совпадают, строк: {len(live)}'))
+            return
+
+        count = rebuild_cart_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Итоги списков покупок пересобраны, строк: {count}'))
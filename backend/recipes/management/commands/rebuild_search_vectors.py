@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.search import is_postgresql, update_search_vectors
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает поисковые векторы рецептов (Postgres), '
+            'например после массовой загрузки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Только рецепты без вектора')
+
+    def handle(self, *args, **options):
+        if not is_postgresql():
+            self.stdout.write(
+                'База без полнотекстового поиска, используется индекс '
+                'в памяти процесса')
+            return
+        recipes = Recipe.objects.all()
+        if options['missing']:
+            recipes = recipes.filter(search_vector__isnull=True)
+        count = update_search_vectors(recipes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы пересчитаны: {count}'))
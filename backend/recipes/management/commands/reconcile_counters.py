@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.counters import COUNTERS, get_counter_drift, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики рецептов, избранного, списков покупок '
+            'и подписчиков или только сверяет их (--check)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счётчики, ничего не меняя')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            total = 0
+            for model, field, counted, link in COUNTERS:
+                drift = get_counter_drift(model, field, counted, link)
+                for row in drift[:20]:
+                    self.stdout.write(
+                        f'{model._meta.verbose_name} {row.pk}: {field} = '
+                        f'{getattr(row, field)}, на самом деле {row.live}')
+                total += drift.count()
+            if total:
+                raise CommandError(f'Расхождений: {total}')
+            self.stdout.write(self.style.SUCCESS('Счётчики совпадают'))
+            return
+
+        for field, fixed in reconcile_counters().items():
+            self.stdout.write(f'{field}: исправлено строк {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Min, Sum
+
+from recipes.models import Favorite, IngredientInRecipe, ShoppingCart
+
+# Модель, поля уникального ограничения и поле, которое у оставшейся
+# строки становится суммой по дубликатам.
+UNIQUE_ROWS = (
+    (IngredientInRecipe, ('recipe_id', 'ingredient_id'), 'amount'),
+    (Favorite, ('recipe_lover_id', 'recipe_id'), None),
+    (ShoppingCart, ('cart_owner_id', 'recipe_id'), None),
+)
+
+
+def remove_duplicates(model, fields, summed):
+    """
+    Оставляет по одной строке (с наименьшим id) на набор fields.
+    Работает SQL-запросами без сигналов, поэтому годится для схемы
+    до migrate; итоги и счётчики потом пересобирают свои команды.
+    Возвращает число удалённых строк.
+    """
+    table = model._meta.db_table
+    if table not in connection.introspection.table_names():
+        return 0
+    aggregates = {'rows': Count('id'), 'keep': Min('id')}
+    if summed:
+        aggregates['total'] = Sum(summed)
+    groups = model.objects.values(*fields).annotate(
+        **aggregates).filter(rows__gt=1).order_by()
+    removed = 0
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for group in groups.iterator():
+            if summed:
+                model.objects.filter(pk=group['keep']).update(
+                    **{summed: group['total']})
+            cursor.execute(
+                f'DELETE FROM {quote(table)} WHERE id <> %s AND '
+                + ' AND '.join(f'{quote(field)} = %s' for field in fields),
+                [group['keep'], *(group[field] for field in fields)])
+            removed += cursor.rowcount
+    return removed
+
+
+class Command(BaseCommand):
+    help = ('Удаляет дубликаты ингредиентов рецептов, избранного и списков '
+            'покупок. Запускается перед migrate, который создаёт '
+            'уникальные ограничения на эти строки')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for model, fields, summed in UNIQUE_ROWS:
+            removed = remove_duplicates(model, fields, summed)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: удалено {removed}')
+        self.stdout.write(self.style.SUCCESS('Дубликаты удалены'))
@@ -1,10 +1,25 @@
 from django.conf import settings
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
+from api.storage import ContentAddressedStorage
 from api.validators import validate_hex, validate_ingredient_name
-from users.models import User
+from users.models import CounterFieldsMixin, User
+
+
+class SearchVectorIndex(GinIndex):
+    """
+    GIN-индекс поискового вектора. Объявлен для любой базы, чтобы
+    миграции не зависели от того, где их создали; вне Postgres
+    создаётся обычным индексом (поиск там идёт по индексу в памяти).
+    """
+    def create_sql(self, model, schema_editor, using=''):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using)
+        return super().create_sql(model, schema_editor, using)
 
 
 class Tag(models.Model):
@@ -47,7 +62,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         verbose_name='Автор', related_name='recipe')
@@ -56,9 +71,13 @@ class Recipe(models.Model):
         validators=[validate_ingredient_name])
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
         null=True,
         default=None,
         verbose_name='Фотография блюда')
+    image_variants_ready = models.BooleanField(
+        default=False, editable=False,
+        verbose_name='Уменьшенные копии готовы')
     text = models.TextField(
         verbose_name='Описание')
     tags = models.ManyToManyField(
@@ -71,15 +90,32 @@ class Recipe(models.Model):
             MaxValueValidator(600, 'Превышен лимит времени приготовления')])
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name='Дата публикации')
+    updated_at = models.DateTimeField(
+        auto_now=True, null=True, verbose_name='Дата изменения')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В списках покупок')
+    search_vector = SearchVectorField(
+        null=True, editable=False, verbose_name='Поисковый вектор')
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
-        ordering = ['-pub_date', ]
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         constraints = [
             models.UniqueConstraint(fields=['author', 'name'],
                                     name='unique_author_recipename')
         ]
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            SearchVectorIndex(fields=['search_vector'],
+                              name='recipe_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -106,6 +142,10 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_recipe_ingredient')
+        ]
 
 
 class Favorite(models.Model):
@@ -121,6 +161,10 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Любимый рецепт'
         verbose_name_plural = 'Любимые рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe_lover', 'recipe'],
+                                    name='unique_recipe_lover_recipe')
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -139,3 +183,73 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['cart_owner', 'recipe'],
+                                    name='unique_cart_owner_recipe')
+        ]
+
+
+class ShoppingCartTotal(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя.
+    Обновляется при изменении корзины и ингредиентов рецептов,
+    чтобы список покупок читался без агрегации.
+    """
+    cart_owner = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        verbose_name='Владелец списка покупок',
+        related_name='shopping_cart_totals')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='+')
+    amount = models.IntegerField(
+        verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['cart_owner', 'ingredient'],
+                                    name='unique_cart_owner_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}: {self.amount}'
+
+
+class MediaFile(models.Model):
+    """
+    Файл в хранилище по хэшу содержимого и число рецептов,
+    которые на него ссылаются. Файлы без ссылок удаляет
+    команда collect_media_garbage.
+    """
+    name = models.CharField(
+        verbose_name='Файл', max_length=255, unique=True)
+    references = models.PositiveIntegerField(
+        verbose_name='Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
+
+
+class RecipeIngredientsChange(models.Model):
+    """
+    Журнал изменений состава рецептов для индекса подбора рецептов
+    (api.cook): процессы догоняют свой индекс по новым записям.
+    Запись добавляется в транзакции изменения, id выдаёт база.
+    """
+    recipe_id = models.PositiveIntegerField(verbose_name='id рецепта')
+    created = models.DateTimeField(
+        verbose_name='Когда изменён', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Изменение состава рецепта'
+        verbose_name_plural = 'Изменения состава рецептов'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.created}'
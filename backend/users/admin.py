@@ -12,7 +12,10 @@ class UserAdmin(admin.ModelAdmin):
         'first_name',
         'last_name',
         'password',
+        'recipes_count',
+        'followers_count',
     )
+    readonly_fields = ('recipes_count', 'followers_count')
     list_filter = ('username',)
 
 
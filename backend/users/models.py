@@ -6,7 +6,29 @@ from django.db import models
 from api.validators import validate_real_name, validate_username
 
 
-class User(AbstractUser):
+class CounterFieldsMixin:
+    """
+    Счётчики counter_fields меняют только change_counter
+    и reconcile_counters выражениями F(). Полное сохранение загруженного
+    объекта (профиль, админка, редактирование рецепта) их не пишет,
+    иначе значения на момент загрузки затёрли бы изменения сигналов.
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.counter_fields]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+class User(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         'Логин', max_length=settings.USER_MAX_LENGTH, unique=True,
         validators=[UnicodeUsernameValidator, validate_username])
@@ -20,6 +42,11 @@ class User(AbstractUser):
         'Пароль', max_length=settings.USER_MAX_LENGTH)
     email = models.EmailField(
         'Email', max_length=settings.EMAIL_MAX_LENGTH, unique=True)
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
+    counter_fields = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 